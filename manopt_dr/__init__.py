@@ -6,6 +6,6 @@ __URL__ = "https://github.com/takanori-fujiwara/ulca"
 import sys
 
 __all__ = [
-    'core', 'predefined_func_generator', '__author__', '__copyright__',
-    '__license__', '__URL__'
+    'core', 'group_stats', 'predefined_func_generator', 'projection',
+    '__author__', '__copyright__', '__license__', '__URL__'
 ]
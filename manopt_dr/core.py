@@ -2,6 +2,9 @@
 ### NOTE: install pymanopt from github. Don't use pip3 install pymanopt
 ### https://github.com/pymanopt/pymanopt
 ###
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
 import autograd.numpy as np
 
 import pymanopt
@@ -10,11 +13,31 @@ from pymanopt.optimizers import TrustRegions
 
 from factor_analyzer import Rotator
 
+from manopt_dr.group_stats import GroupStats
+from manopt_dr.projection import save_fitted, load_fitted
+
+# LDR classes generated by gen_ldr, used to restore pickled instances
+_ldr_classes = {}
+
+
+def _restore_ldr(gen_args):
+    # LDR classes are local to gen_ldr and cannot be pickled by name.
+    # instances are restored as ones of the class generated with the same
+    # arguments of gen_ldr
+    cls = _ldr_classes.get(gen_args)
+    if cls is None:
+        cls = gen_ldr(gen_args[0],
+                      gen_args[1],
+                      manifold_generator=gen_args[2],
+                      precompute_func=gen_args[3])
+    return cls.__new__(cls)
+
 
 def gen_ldr(cost_func_generator,
             project_func_generator,
             manifold_generator=Grassmann,
-            optimizer=TrustRegions()):
+            optimizer=TrustRegions(),
+            precompute_func=None):
     """Linear dimensionality reduction method generator using manifold optimization as a general optimization problem optimizer.
 
     Parameters
@@ -28,6 +51,11 @@ def gen_ldr(cost_func_generator,
         - cPCA (gen_cost_cpca)
         - ccPCA (gen_cost_ccpca)
         - ULCA (gen_cost_ulca)
+        A generator returns either a cost function decorated with
+        pymanopt.function (e.g., pymanopt.function.autograd) or a dictionary
+        of keyword arguments of pymanopt.Problem (e.g., {'cost': cost,
+        'euclidean_gradient': egrad, 'euclidean_hessian': ehess}) to provide
+        closed-form derivatives.
     project_func_generator: function generator
         Generator of projection function of linear dimensionality reduction.
         Example can be found in predefined_func_generator.py, such as gen_default_proj.
@@ -43,6 +71,11 @@ def gen_ldr(cost_func_generator,
         Other settings and optimizers can be used.
         For example, pymanopt.optimizers.SteepestDescent().
         Refer to https://www.pymanopt.org/ for more details.
+    precompute_func: None or function, optional, (default=None)
+        Function called once by fit_many with the arguments shared by all fits.
+        It returns a dictionary of keyword arguments passed to all fits (e.g.,
+        precomputed statistics). Example can be found in
+        predefined_func_generator.py, such as precompute_ulca.
 
     Return
     ----------
@@ -89,6 +122,11 @@ def gen_ldr(cost_func_generator,
         verbosity: int, optional, (default=0)
             Level of information logged by the optimizer while it operates, 0 is
             silent, 2 is most information. Refer to https://www.pymanopt.org/.
+        warm_start: bool, optional, (default=False)
+            If True, fit starts the optimization from the previous optimized
+            projection matrix (M_opt) instead of a random point. This reduces
+            the number of iterations and stabilizes results when consecutive
+            fits use slightly different parameters (e.g., in the UI).
         Attributes
         ----------
         n_components: int
@@ -103,12 +141,24 @@ def gen_ldr(cost_func_generator,
             Optimizer class used for solving manifold optimization problem.
         M: numpy array, shape(n_features, n_components)
             Projection matrix.
+        M_opt: numpy array, shape(n_features, n_components)
+            Projection matrix obtained by the optimizer before varimax rotation
+            and adjustment of axes.
         apply_varimax: bool
             Applying varimax rotation to the obtained components or not.
         apply_consist_axes:
             Applying adjustment of signs of axes and order of axes or not.
         verbosity: int
             Level of information logged.
+        warm_start: bool
+            Starting the optimization from the previous M_opt or not.
+        mean: numpy array, shape(n_features,)
+            Mean of training data (stored for saving and transforming new
+            data).
+
+        Instances can be pickled and saved with save (without the
+        optimization problem). Saved instances can be loaded with load or,
+        without pymanopt, with manopt_dr.projection.Projection.
         """
 
         def __init__(self,
@@ -117,7 +167,8 @@ def gen_ldr(cost_func_generator,
                      convergence_ratio=1e-2,
                      apply_varimax=True,
                      apply_consist_axes=True,
-                     verbosity=0):
+                     verbosity=0,
+                     warm_start=False):
             self.n_components = n_components
             self.cost_func_generator = cost_func_generator
             self.manifold_generator = manifold_generator
@@ -126,16 +177,42 @@ def gen_ldr(cost_func_generator,
             self.optimizer._min_gradient_norm = convergence_ratio
             self.project_func_generator = project_func_generator
             self.M = None
+            self.M_opt = None
             self.projector = None
             self.apply_varimax = apply_varimax
             self.apply_consist_axes = apply_consist_axes
             self.verbosity = verbosity
+            self.warm_start = warm_start
+            self.mean = None
+
+        def __reduce__(self):
+            return (_restore_ldr, (self._gen_args, ), self.__getstate__())
+
+        def __getstate__(self):
+            # the optimization problem (holding autograd functions) and the
+            # projector (a closure) cannot be pickled. the final cost is kept
+            # instead of the problem, and the projector is regenerated from M
+            state = self.__dict__.copy()
+            problem = state.pop('problem', None)
+            if problem is not None and self.M is not None:
+                state['final_cost'] = float(problem.cost(self.M))
+            state['projector'] = None
+            return state
 
-        def fit(self, *args, **kwargs):
+        def __setstate__(self, state):
+            self.__dict__.update(state)
+            if self.M is not None:
+                self.projector = self.project_func_generator(self.M)
+
+        def fit(self, *args, init=None, **kwargs):
             """fit method similar to other DR classes in scikit-learn
             Parameters
             ----------
             args: arguments
+            init: None or numpy array, shape(n_features, n_components), optional, (default=None)
+                Initial point of the optimization. If None and warm_start is
+                True, the previous M_opt is used (when its shape matches).
+                Otherwise, a random point is used.
             kwargs: keyward arguments
 
             Returns
@@ -144,10 +221,21 @@ def gen_ldr(cost_func_generator,
             """
             manifold = self.manifold_generator(args[0].shape[1],
                                                self.n_components)
-            self.problem = pymanopt.Problem(
-                manifold, cost_func_generator(manifold, *args, **kwargs))
+            funcs = cost_func_generator(manifold, *args, **kwargs)
+            if not isinstance(funcs, dict):
+                funcs = {'cost': funcs}
+            self.problem = pymanopt.Problem(manifold, **funcs)
             self.optimizer._verbosity = self.verbosity
-            self.M = self.optimizer.run(self.problem).point
+            Covs = kwargs.get('Covs')
+            self.mean = Covs.mean if isinstance(
+                Covs, GroupStats) else np.asarray(args[0]).mean(axis=0)
+
+            if init is None and self.warm_start and self.M_opt is not None:
+                if self.M_opt.shape == (args[0].shape[1], self.n_components):
+                    init = self.M_opt
+            self.M_opt = self.optimizer.run(self.problem,
+                                            initial_point=init).point
+            self.M = self.M_opt
 
             if self.apply_varimax and self.n_components > 1:
                 self.M = Rotator(method='varimax').fit_transform(self.M)
@@ -161,17 +249,61 @@ def gen_ldr(cost_func_generator,
 
             return self
 
-        def transform(self, *args, **kwargs):
+        def fit_many(self, *args, params_list=[], n_jobs=None, **kwargs):
+            """Apply fit for many parameter settings in parallel with a thread
+            pool. self is not updated.
+            Parameters
+            ----------
+            args: arguments shared by all fits
+            params_list: list of dictionaries
+                Keyword arguments of fit for each setting.
+                (e.g., for ULCA, [{'w_tg': w_tg1, 'w_bg': w_bg1, 'w_bw': w_bw1},
+                                  {'w_tg': w_tg2, 'w_bg': w_bg2, 'w_bw': w_bw2}])
+            n_jobs: None or int, optional, (default=None)
+                Number of threads. If None, the number of CPUs is used.
+            kwargs: keyward arguments shared by all fits
+
+            Returns
+            -------
+            Projection matrices: numpy array, shape(n_settings, n_features, n_components).
+            """
+            if precompute_func is not None:
+                kwargs = {**kwargs, **precompute_func(*args, **kwargs)}
+
+            def fit_one(params):
+                dr = copy.copy(self)
+                dr.optimizer = copy.deepcopy(self.optimizer)
+                dr.fit(*args, **{**kwargs, **params})
+                return dr.M
+
+            if n_jobs == 1:
+                Ms = [fit_one(params) for params in params_list]
+            else:
+                with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                    Ms = list(executor.map(fit_one, params_list))
+
+            return np.array(Ms)
+
+        def transform(self, *args, subtract_mean=False, **kwargs):
             """transform method similar to other DR classes in scikit-learn
             Parameters
             ----------
             args: arguments
+            subtract_mean: bool, optional, (default=False)
+                If True, the mean of training data (mean) is subtracted from
+                data before the projection.
             kwargs: keyward arguments
+                With gen_default_proj, out, dtype, and n_jobs of
+                manopt_dr.projection.project are available (e.g., for
+                projecting large data with multiple threads into a
+                memory-mapped array).
 
             Returns
             -------
             Embedding result: numpy array, shape(n_instances, n_components).
             """
+            if subtract_mean:
+                kwargs['mean'] = self.mean
             return self.projector(*args, **kwargs)
 
         def fit_transform(self, *args, **kwargs):
@@ -193,8 +325,55 @@ def gen_ldr(cost_func_generator,
             -------
             cost: float
             """
+            if getattr(self, 'problem', None) is None:
+                # the cost kept when pickled or saved
+                return getattr(self, 'final_cost', None)
             return self.problem.cost(self.M)
 
+        def _settings(self):
+            return {
+                'n_components': self.n_components,
+                'max_iterations': self.optimizer._max_iterations,
+                'convergence_ratio': self.optimizer._min_gradient_norm,
+                'apply_varimax': self.apply_varimax,
+                'apply_consist_axes': self.apply_consist_axes,
+                'verbosity': self.verbosity,
+                'warm_start': self.warm_start
+            }
+
+        def save(self, file):
+            """Save the fitted model (M, mean, final cost, and parameters of
+            the constructor) in the .npz format.
+            Parameters
+            ----------
+            file: str, Path, or file-like object
+                Same with numpy.savez (.npz is appended to a file name without
+                it).
+            """
+            save_fitted(file,
+                        f'LDR({cost_func_generator.__name__})',
+                        self.M,
+                        mean=self.mean,
+                        settings=self._settings(),
+                        final_cost=self.get_final_cost())
+
+        @classmethod
+        def load(cls, file):
+            """Load a fitted model saved with save.
+            Parameters
+            ----------
+            file: str, Path, or file-like object
+                Same with numpy.load.
+            Returns
+            -------
+            LDR instance.
+            """
+            fitted = load_fitted(file)
+            dr = cls(**fitted['settings'])
+            dr.mean = fitted['mean']
+            dr.final_cost = fitted['final_cost']
+            return dr.update_projector(fitted['M'])
+
         def update_projector(self, M):
             """Update information related to projection
             Parameters
@@ -208,4 +387,8 @@ def gen_ldr(cost_func_generator,
             self.projector = self.project_func_generator(self.M)
             return self
 
+    LDR._gen_args = (cost_func_generator, project_func_generator,
+                     manifold_generator, precompute_func)
+    _ldr_classes.setdefault(LDR._gen_args, LDR)
+
     return LDR
@@ -0,0 +1,307 @@
+import numpy as np
+"""
+Per-label sufficient statistics (counts, sums, and within-group scatter
+matrices) used to compute within-group and between-group covariance matrices
+for LDA-like linear dimensionality reduction methods (e.g., ULCA).
+Computing these statistics once and passing them to fit avoids rebuilding
+covariance matrices from the raw data at every refit.
+"""
+
+# default number of elements (rows x features) processed at once
+DEFAULT_BLOCK_ELEMENTS = 2**22
+
+
+class GroupStats():
+    """Per-label sufficient statistics of data.
+    Parameters
+    ----------
+    labels: array-like of shape (n_groups,)
+        Sorted unique labels.
+    counts: array-like of shape (n_groups,)
+        Number of instances of each group.
+    sums: array-like of shape (n_groups, n_features)
+        Sum of instances of each group.
+    scatters: array-like of shape (n_groups, n_features, n_features)
+        Within-group scatter matrix of each group (i.e., sum of outer products
+        of the deviations from the group mean).
+    Attributes
+    ----------
+    labels: numpy array, shape (n_groups,)
+    counts: numpy array, shape (n_groups,)
+    sums: numpy array, shape (n_groups, n_features)
+    scatters: numpy array, shape (n_groups, n_features, n_features)
+
+    Examples
+    --------
+    >>> from sklearn import datasets, preprocessing
+    >>> from manopt_dr.group_stats import GroupStats
+    >>> from ulca.ulca import EVDULCA
+
+    >>> dataset = datasets.load_wine()
+    >>> X = preprocessing.scale(dataset.data)
+    >>> y = dataset.target
+
+    >>> # compute statistics once and reuse them for multiple fits
+    >>> stats = GroupStats.from_data(X, y)
+    >>> ulca = EVDULCA(n_components=2)
+    >>> for w in [0.0, 0.5, 1.0]:
+    ...     w_tg = {0: w, 1: 0, 2: 0}
+    ...     ulca = ulca.fit(X, y, w_tg, {0: 1, 1: 1, 2: 1}, {0: 1, 1: 1, 2: 1},
+    ...                     Covs=stats)
+    """
+
+    def __init__(self, labels, counts, sums, scatters):
+        self.labels = np.asarray(labels)
+        self.counts = np.asarray(counts, dtype=int)
+        self.sums = np.asarray(sums, dtype=float)
+        self.scatters = np.asarray(scatters, dtype=float)
+
+    @classmethod
+    def from_data(cls, X, y, block_size=None):
+        """Compute statistics from data with a single pass over row blocks.
+        Only one block of X is processed at a time, so the extra memory is
+        O(block_size * n_features + n_groups * n_features^2).
+        Parameters
+        ----------
+        X: array-like of shape(n_samples, n_features)
+            Data.
+        y: array-like of shape (n_samples,)
+            Labels of data's instances.
+        block_size: None or int, optional, (default=None)
+            Number of rows processed at once. If None, a block size keeping
+            each block around DEFAULT_BLOCK_ELEMENTS elements is used.
+        Returns
+        -------
+        GroupStats instance.
+        """
+        y = np.asarray(y)
+        labels = np.unique(y)
+        d = X.shape[1]
+        stats = cls(labels, np.zeros(len(labels), dtype=int),
+                    np.zeros((len(labels), d)),
+                    np.zeros((len(labels), d, d)))
+
+        return stats.update(X, y, block_size=block_size)
+
+    def update(self, X, y, block_size=None):
+        """Accumulate statistics of additional data (e.g., a chunk of data
+        streamed from files) in place. Labels that have not been seen yet are
+        added.
+        Parameters
+        ----------
+        X: array-like of shape(n_samples, n_features)
+            Additional data.
+        y: array-like of shape (n_samples,)
+            Labels of additional data's instances.
+        block_size: None or int, optional, (default=None)
+            Number of rows processed at once. If None, a block size keeping
+            each block around DEFAULT_BLOCK_ELEMENTS elements is used.
+        Returns
+        -------
+        self.
+        """
+        y = np.asarray(y)
+        self._add_labels(np.unique(y))
+        label_index = np.searchsorted(self.labels, y)
+        n, d = X.shape
+        if block_size is None:
+            block_size = max(1, DEFAULT_BLOCK_ELEMENTS // max(d, 1))
+
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            _accumulate_block(self.counts, self.sums, self.scatters,
+                              np.asarray(X[start:end], dtype=float),
+                              label_index[start:end])
+
+        return self
+
+    def merge(self, other):
+        """Merge statistics computed from another part of data in place (e.g.,
+        statistics computed from different files in parallel).
+        Parameters
+        ----------
+        other: GroupStats
+            Statistics to be merged.
+        Returns
+        -------
+        self.
+        """
+        self._add_labels(other.labels)
+        for k_other, k in enumerate(np.searchsorted(self.labels,
+                                                    other.labels)):
+            n_a = self.counts[k]
+            n_b = other.counts[k_other]
+            if n_a > 0 and n_b > 0:
+                delta = other.sums[k_other] / n_b - self.sums[k] / n_a
+                self.scatters[k] += (n_a * n_b /
+                                     (n_a + n_b)) * np.outer(delta, delta)
+            self.scatters[k] += other.scatters[k_other]
+            self.counts[k] += n_b
+            self.sums[k] += other.sums[k_other]
+
+        return self
+
+    def _weight_array(self, weights):
+        return np.array([weights[label] for label in self.labels],
+                        dtype=float)
+
+    def _add_labels(self, labels):
+        new_labels = np.setdiff1d(labels, self.labels)
+        if len(new_labels) == 0:
+            return
+
+        all_labels = np.union1d(self.labels, new_labels)
+        c = len(all_labels)
+        d = self.n_features
+        positions = np.searchsorted(all_labels, self.labels)
+
+        counts = np.zeros(c, dtype=int)
+        sums = np.zeros((c, d))
+        scatters = np.zeros((c, d, d))
+        counts[positions] = self.counts
+        sums[positions] = self.sums
+        scatters[positions] = self.scatters
+
+        self.labels = all_labels
+        self.counts = counts
+        self.sums = sums
+        self.scatters = scatters
+
+    @property
+    def n_groups(self):
+        return len(self.labels)
+
+    @property
+    def n_features(self):
+        return self.sums.shape[1]
+
+    @property
+    def n_samples(self):
+        return int(self.counts.sum())
+
+    @property
+    def means(self):
+        """Mean of each group, shape (n_groups, n_features)."""
+        return self.sums / self.counts[:, None]
+
+    @property
+    def mean(self):
+        """Mean of all instances, shape (n_features,)."""
+        return self.sums.sum(axis=0) / self.n_samples
+
+    def index(self, label):
+        """Position of label in labels."""
+        return int(np.flatnonzero(self.labels == label)[0])
+
+    def within(self, label, normalize=False):
+        """Within-group scatter (normalize=False) or covariance
+        (normalize=True) matrix of the group with label.
+        """
+        i = self.index(label)
+        return self.scatters[i] / self.counts[i] if normalize else self.scatters[
+            i]
+
+    def between(self, label, centering=True, normalize=False):
+        """Between-group scatter (normalize=False) or covariance
+        (normalize=True) matrix of the group with label.
+        If centering is True, the group mean is measured from the mean of all
+        instances. Otherwise, from the origin.
+        """
+        i = self.index(label)
+        diff = self.means[i] - self.mean if centering else self.means[i]
+        n = 1 if normalize else self.counts[i]
+        return n * np.outer(diff, diff)
+
+    def weighted_covs(self,
+                      w_tg,
+                      w_bg,
+                      w_bw,
+                      centering=True,
+                      normalize=False,
+                      out=None):
+        """Weighted sums of within-group and between-group scatter
+        (normalize=False) or covariance (normalize=True) matrices used by ULCA.
+        Within-group parts of both sums are obtained with a single contraction
+        of the stacked scatter matrices, and the between-group part is added
+        as a rank-n_groups update.
+        Parameters
+        ----------
+        w_tg, w_bg, w_bw: array-like of shape (n_groups,) or dictionary
+            Weights of each label (same with ULCA's fit).
+        centering: bool, optional, (default=True)
+            Same with between.
+        normalize: bool, optional, (default=False)
+            If True, each group's matrices are divided by the group size.
+        out: None or numpy array of shape (2, n_features, n_features)
+            If provided, the result is written into out.
+        Returns
+        -------
+        out: numpy array of shape (2, n_features, n_features)
+            out[0] is sum_k (w_tg[k] * within_k + w_bw[k] * between_k) and
+            out[1] is sum_k w_bg[k] * within_k.
+        """
+        c = self.n_groups
+        d = self.n_features
+        if out is None:
+            out = np.empty((2, d, d))
+
+        scale = 1 / self.counts if normalize else np.ones(c)
+        W = np.vstack((self._weight_array(w_tg) * scale,
+                       self._weight_array(w_bg) * scale))
+        np.dot(W, self.scatters.reshape(c, d * d), out=out.reshape(2, d * d))
+
+        diff = self.means - self.mean if centering else self.means
+        coef = self._weight_array(w_bw) * (1 if normalize else self.counts)
+        out[0] += (diff.T * coef) @ diff
+
+        return out
+
+    def to_covs(self, centering=True, normalize=False):
+        """Convert to the dictionary format of covariance matrices used by
+        Covs in ULCA's fit.
+        Returns
+        -------
+        Dictionary where key is a label and item is a dictionary with
+        'within' and 'between' keys.
+        """
+        return {
+            label: {
+                'within': self.within(label, normalize=normalize),
+                'between': self.between(label,
+                                        centering=centering,
+                                        normalize=normalize)
+            }
+            for label in self.labels
+        }
+
+
+def _accumulate_block(counts, sums, scatters, X_block, label_index_block):
+    """Merge statistics of one block of rows into counts, sums, and scatters
+    in place. Rows are sorted by label so that each group is a contiguous
+    slice (group sums are obtained with np.add.reduceat of the slices), and
+    each group's scatter is merged with the pairwise update of Chan et al. to
+    avoid cancellation errors of raw second moments.
+    """
+    c = len(counts)
+    block_counts = np.bincount(label_index_block, minlength=c)
+
+    # sort rows by label to take each group as a contiguous slice
+    order = np.argsort(label_index_block, kind='stable')
+    X_sorted = X_block[order]
+    ends = np.cumsum(block_counts)
+    present = np.flatnonzero(block_counts)
+    block_sums = np.zeros((c, X_block.shape[1]))
+    block_sums[present] = np.add.reduceat(X_sorted,
+                                          ends[present] - block_counts[present],
+                                          axis=0)
+    for k in present:
+        n_a = counts[k]
+        n_b = block_counts[k]
+        mean_b = block_sums[k] / n_b
+        WI = X_sorted[ends[k] - n_b:ends[k]] - mean_b
+        scatters[k] += WI.T @ WI
+        if n_a > 0:
+            delta = mean_b - sums[k] / n_a
+            scatters[k] += (n_a * n_b / (n_a + n_b)) * np.outer(delta, delta)
+    counts += block_counts
+    sums += block_sums
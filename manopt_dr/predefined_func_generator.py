@@ -1,5 +1,8 @@
 import autograd.numpy as np
 import pymanopt
+
+from manopt_dr.group_stats import GroupStats
+from manopt_dr.projection import project
 """
 Exaples of cost and projection fuctions to generate linear dimensionality
 reduction class with gen_ldr in core.py
@@ -9,97 +12,188 @@ Implemented cost function genertors:
     - cPCA (gen_cost_cpca)
     - ccPCA (gen_cost_ccpca)
     - ULCA (gen_cost_ulca)
+Implemented precomputation functions (used by fit_many):
+    - ULCA (precompute_ulca)
 Implemented projection function genertors:
     - Matrix multiplication with data and projection matrix (gen_default_proj)
+Helpers to generate cost functions with closed-form Euclidean gradients and
+Hessians (used when use_autograd=False):
+    - Trace: tr(M^T C M) (gen_trace_funcs)
+    - Trace ratio: tr(M^T A M) / tr(M^T B M) (gen_trace_ratio_funcs)
 """
 
 
 def gen_default_proj(M):
 
-    def proj(X, *args, **kwargs):
-        return X @ M
+    def proj(X, *args, mean=None, out=None, dtype=None, n_jobs=1, **kwargs):
+        # project in row blocks so that memory-mapped X (e.g., np.load with
+        # mmap_mode='r') is read block by block without a full in-memory copy
+        # (refer to project for mean, out, dtype, and n_jobs)
+        return project(X, M, mean=mean, out=out, dtype=dtype, n_jobs=n_jobs)
 
     return proj
 
 
-def gen_cost_pca(manifold, X):
-    X_c = X - X.mean(axis=0)
+def gen_trace_funcs(manifold, C, const=0, use_autograd=False):
+    """Generate cost(M) = const + tr(M^T C M) for symmetric C.
+    Returns
+    -------
+    If use_autograd is True, cost function differentiated by autograd.
+    Otherwise, dictionary of cost, euclidean_gradient, and euclidean_hessian,
+    which can be used as keyword arguments of pymanopt.Problem.
+    """
+    if use_autograd:
+
+        @pymanopt.function.autograd(manifold)
+        def cost(M):
+            return const + np.trace(M.T @ C @ M)
+
+        return cost
 
-    @pymanopt.function.autograd(manifold)
+    @pymanopt.function.numpy(manifold)
     def cost(M):
-        # this is based on Cunningham et al., 2015
-        # but probably, using Cov is faster
-        return np.linalg.norm(X_c - X_c @ M @ M.T)**2
+        return const + np.sum(M * (C @ M))
+
+    @pymanopt.function.numpy(manifold)
+    def euclidean_gradient(M):
+        return 2 * C @ M
+
+    @pymanopt.function.numpy(manifold)
+    def euclidean_hessian(M, H):
+        return 2 * C @ H
+
+    return {
+        'cost': cost,
+        'euclidean_gradient': euclidean_gradient,
+        'euclidean_hessian': euclidean_hessian
+    }
+
+
+def gen_trace_ratio_funcs(manifold, A, B, use_autograd=False):
+    """Generate cost(M) = tr(M^T A M) / tr(M^T B M) for symmetric A and B.
+    If A (or B) is None, the numerator (or denominator) is 1.
+    Returns
+    -------
+    If use_autograd is True, cost function differentiated by autograd.
+    Otherwise, dictionary of cost, euclidean_gradient, and euclidean_hessian,
+    which can be used as keyword arguments of pymanopt.Problem.
+    """
+    if use_autograd:
+
+        @pymanopt.function.autograd(manifold)
+        def cost(M):
+            numerator = 1 if A is None else np.trace(M.T @ A @ M)
+            denominator = 1 if B is None else np.trace(M.T @ B @ M)
+            return numerator / denominator
 
-    return cost
+        return cost
+
+    # A @ M and B @ M at the last evaluated point (cost, gradient, and
+    # Hessian are usually evaluated at the same point)
+    cache = {'M': None}
 
+    def products(M):
+        if cache['M'] is None or not np.array_equal(cache['M'], M):
+            AM = np.zeros(M.shape) if A is None else A @ M
+            BM = np.zeros(M.shape) if B is None else B @ M
+            a = 1 if A is None else np.sum(M * AM)
+            b = 1 if B is None else np.sum(M * BM)
+            cache.update({'M': M.copy(), 'AM': AM, 'BM': BM, 'a': a, 'b': b})
+        return cache['AM'], cache['BM'], cache['a'], cache['b']
 
-def gen_cost_lda(manifold, X, y):
+    @pymanopt.function.numpy(manifold)
+    def cost(M):
+        _, _, a, b = products(M)
+        return a / b
+
+    @pymanopt.function.numpy(manifold)
+    def euclidean_gradient(M):
+        AM, BM, a, b = products(M)
+        return 2 / b * (AM - a / b * BM)
+
+    @pymanopt.function.numpy(manifold)
+    def euclidean_hessian(M, H):
+        AM, BM, a, b = products(M)
+        f = a / b
+        AH = np.zeros(H.shape) if A is None else A @ H
+        BH = np.zeros(H.shape) if B is None else B @ H
+        # directional derivatives of a, b, and f along H
+        da = 2 * np.sum(AM * H)
+        db = 2 * np.sum(BM * H)
+        df = (da - f * db) / b
+
+        return 2 / b * (AH - f * BH - df * BM) - 2 * db / b**2 * (AM - f * BM)
+
+    return {
+        'cost': cost,
+        'euclidean_gradient': euclidean_gradient,
+        'euclidean_hessian': euclidean_hessian
+    }
+
+
+def gen_cost_pca(manifold, X, use_autograd=False):
     X_c = X - X.mean(axis=0)
 
-    all_mean = X_c.mean()  # should be 0
-    class_mean = {}
-    for label in np.unique(y):
-        class_mean[label] = X_c[y == label, :].mean(axis=0)
+    if use_autograd:
+
+        @pymanopt.function.autograd(manifold)
+        def cost(M):
+            # this is based on Cunningham et al., 2015
+            # but probably, using Cov is faster
+            return np.linalg.norm(X_c - X_c @ M @ M.T)**2
 
-    X_class_mean = np.zeros(X.shape)
-    for label in np.unique(y):
-        X_class_mean[y == label, :] = class_mean[label]
+        return cost
 
-    Cov_within = (X_c - X_class_mean).T @ (X_c - X_class_mean)
-    Cov_between = (X_class_mean - all_mean).T @ (X_class_mean - all_mean)
+    # ||X_c - X_c M M^T||^2 = tr(Cov) - tr(M^T Cov M) when M^T M = I
+    Cov = X_c.T @ X_c
+    return gen_trace_funcs(manifold, -Cov, const=np.trace(Cov))
 
-    @pymanopt.function.autograd(manifold)
-    def cost(M):
-        return np.trace(M.T @ Cov_within @ M) / np.trace(M.T @ Cov_between @ M)
 
-    return cost
+def gen_cost_lda(manifold, X, y, use_autograd=False):
+    stats = GroupStats.from_data(X, y)
+    BW = np.sqrt(stats.counts)[:, None] * (stats.means - stats.mean)
 
+    Cov_within = stats.scatters.sum(axis=0)
+    Cov_between = BW.T @ BW
 
-def gen_cost_regularized_lda(manifold, X, y, gamma=0):
-    X_c = X - X.mean(axis=0)
+    return gen_trace_ratio_funcs(manifold,
+                                 Cov_within,
+                                 Cov_between,
+                                 use_autograd=use_autograd)
 
-    all_mean = X_c.mean()  # should be 0
-    class_mean = {}
-    for label in np.unique(y):
-        class_mean[label] = X_c[y == label, :].mean(axis=0)
 
-    X_class_mean = np.zeros(X.shape)
-    for label in np.unique(y):
-        X_class_mean[y == label, :] = class_mean[label]
+def gen_cost_regularized_lda(manifold, X, y, gamma=0, use_autograd=False):
+    stats = GroupStats.from_data(X, y)
+    BW = np.sqrt(stats.counts)[:, None] * (stats.means - stats.mean)
 
-    Cov_within = (X_c - X_class_mean).T @ (X_c - X_class_mean)
-    Cov_between = (X_class_mean - all_mean).T @ (X_class_mean - all_mean)
+    Cov_within = stats.scatters.sum(axis=0)
+    Cov_between = BW.T @ BW
     Cov_between += gamma * np.identity(Cov_between.shape[0])
 
-    @pymanopt.function.autograd(manifold)
-    def cost(M):
-        return np.trace(M.T @ Cov_within @ M) / np.trace(M.T @ Cov_between @ M)
-
-    return cost
+    return gen_trace_ratio_funcs(manifold,
+                                 Cov_within,
+                                 Cov_between,
+                                 use_autograd=use_autograd)
 
 
-def gen_cost_cpca(manifold, X_tg, X_bg, alpha=None):
+def gen_cost_cpca(manifold, X_tg, X_bg, alpha=None, use_autograd=False):
     X_tg_c = X_tg - X_tg.mean(axis=0)
     X_bg_c = X_bg - X_bg.mean(axis=0)
     Cov_tg = X_tg_c.T @ X_tg_c / X_tg_c.shape[0]
     Cov_bg = X_bg_c.T @ X_bg_c / X_bg_c.shape[0]
 
-    @pymanopt.function.autograd(manifold)
-    def cost(M):
-        return np.trace(M.T @ Cov_bg @ M) / np.trace(M.T @ Cov_tg @ M)
-
-    @pymanopt.function.autograd(manifold)
-    def cost_with_alpha(M):
-        return np.trace(M.T @ (alpha * Cov_bg - Cov_tg) @ M)
-
     if alpha:
-        return cost_with_alpha
+        return gen_trace_funcs(manifold,
+                               alpha * Cov_bg - Cov_tg,
+                               use_autograd=use_autograd)
     else:
-        return cost
+        return gen_trace_ratio_funcs(manifold,
+                                     Cov_bg,
+                                     Cov_tg,
+                                     use_autograd=use_autograd)
 
 
-def gen_cost_ccpca(manifold, X_tg, X_bg, alpha=None):
+def gen_cost_ccpca(manifold, X_tg, X_bg, alpha=None, use_autograd=False):
     X = np.vstack((X_tg, X_bg))
     X_c = X - X.mean(axis=0)
     X_bg_c = X_bg - X_bg.mean(axis=0)
@@ -107,18 +201,23 @@ def gen_cost_ccpca(manifold, X_tg, X_bg, alpha=None):
     Cov_all = X_c.T @ X_c / X_c.shape[0]
     Cov_bg = X_bg_c.T @ X_bg_c / X_bg_c.shape[0]
 
-    @pymanopt.function.autograd(manifold)
-    def cost(M):
-        return np.trace(M.T @ Cov_bg @ M) / np.trace(M.T @ Cov_all @ M)
+    if alpha:
+        return gen_trace_funcs(manifold,
+                               alpha * Cov_bg - Cov_all,
+                               use_autograd=use_autograd)
+    else:
+        return gen_trace_ratio_funcs(manifold,
+                                     Cov_bg,
+                                     Cov_all,
+                                     use_autograd=use_autograd)
 
-    @pymanopt.function.autograd(manifold)
-    def cost_with_alpha(M):
-        return np.trace(M.T @ (alpha * Cov_bg - Cov_all) @ M)
 
-    if alpha:
-        return cost_with_alpha
+def precompute_ulca(X, y=None, Covs={}, **kwargs):
+    # compute group statistics once for multiple fits with gen_cost_ulca
+    if not isinstance(Covs, GroupStats) and len(Covs.keys()) == 0:
+        return {'Covs': GroupStats.from_data(X, y)}
     else:
-        return cost
+        return {}
 
 
 def gen_cost_ulca(manifold,
@@ -131,53 +230,37 @@ def gen_cost_ulca(manifold,
                   alpha=None,
                   centering=True,
                   gamma0=None,
-                  gamma1=None):
-    labels = np.unique(y)
-    _Covs = {}
-
+                  gamma1=None,
+                  use_autograd=False):
     # when Covs are provided, covariance computation here will be skipped
-    if len(Covs.keys()) == 0:
-        if centering:
-            X_c = X - X.mean(axis=0)
-
-        class_mean = {}
-        for label in labels:
-            class_mean[label] = X_c[y == label, :].mean(axis=0)
-
-        X_class_mean = np.zeros(X.shape)
-        for label in labels:
-            X_class_mean[y == label, :] = class_mean[label]
-
-        all_mean = 0  # this equals to X_c.mean()
+    if isinstance(Covs, GroupStats):
+        stats = Covs
+    elif len(Covs.keys()) == 0:
+        stats = GroupStats.from_data(X, y)
+    else:
+        stats = None
 
+    if stats is None:
+        labels = np.unique(y)
+        d = Covs[labels[0]]['within'].shape[0]
+        C0 = np.zeros((d, d))
+        C1 = np.zeros((d, d))
         for label in labels:
-            # to compute within-cov
-            WI = X_c[y == label, :] - X_class_mean[y == label, :]
-            # to compute between-cov
-            BW = X_class_mean[y == label, :] - all_mean
-            n = np.sum(y == label)
-
-            Cov_within = WI.T @ WI / n
-            Cov_between = BW.T @ BW / n
-            _Covs[label] = {'within': Cov_within, 'between': Cov_between}
+            C0 += w_tg[label] * Covs[label]['within']
+            C0 += w_bw[label] * Covs[label]['between']
+            C1 += w_bg[label] * Covs[label]['within']
     else:
-        _Covs = Covs
-
-    _, d = X.shape
-    Cov_within_tg = np.zeros((d, d))
-    Cov_within_bg = np.zeros((d, d))
-    Cov_between = np.zeros((d, d))
-    w_tg_total = 0
-    w_bg_total = 0
-    w_bw_total = 0
-
-    for label in labels:
-        Cov_within_tg += w_tg[label] * _Covs[label]['within']
-        Cov_within_bg += w_bg[label] * _Covs[label]['within']
-        Cov_between += w_bw[label] * _Covs[label]['between']
-        w_tg_total += w_tg[label]
-        w_bg_total += w_bg[label]
-        w_bw_total += w_bw[label]
+        labels = stats.labels
+        d = stats.n_features
+        C0, C1 = stats.weighted_covs(w_tg,
+                                     w_bg,
+                                     w_bw,
+                                     centering=centering,
+                                     normalize=True)
+
+    w_tg_total = sum(w_tg[label] for label in labels)
+    w_bg_total = sum(w_bg[label] for label in labels)
+    w_bw_total = sum(w_bw[label] for label in labels)
 
     if gamma0 is None:
         if w_tg_total + w_bw_total == 0:
@@ -190,22 +273,16 @@ def gen_cost_ulca(manifold,
         else:
             gamma1 = 0
 
-    C0 = Cov_within_tg + Cov_between + gamma0 * np.identity(d)
-    C1 = Cov_within_bg + gamma1 * np.identity(d)
-
-    @pymanopt.function.autograd(manifold)
-    def cost(M):
-        numerator = 1 if w_bg_total == 0 else np.trace(M.T @ C1 @ M)
-        denominator = 1 if (w_tg_total +
-                            w_bw_total) == 0 else np.trace(M.T @ C0 @ M)
-
-        return numerator / denominator
-
-    @pymanopt.function.autograd(manifold)
-    def cost_with_alpha(M):
-        return np.trace(M.T @ (alpha * C1 - C0) @ M)
+    C0[np.diag_indices(d)] += gamma0
+    C1[np.diag_indices(d)] += gamma1
 
     if alpha:
-        return cost_with_alpha
+        return gen_trace_funcs(manifold,
+                               alpha * C1 - C0,
+                               use_autograd=use_autograd)
     else:
-        return cost
+        return gen_trace_ratio_funcs(
+            manifold,
+            None if w_bg_total == 0 else C1,
+            None if (w_tg_total + w_bw_total) == 0 else C0,
+            use_autograd=use_autograd)
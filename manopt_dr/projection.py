@@ -0,0 +1,263 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from manopt_dr.group_stats import DEFAULT_BLOCK_ELEMENTS
+"""
+Projection with fitted linear dimensionality reduction models and the file
+format of fitted models (.npz file of a projection matrix, alpha, mean of
+training data, and settings). This module does not import pymanopt, so that
+fitted models can be loaded and applied (e.g., by many workers) without
+optimization libraries.
+"""
+
+
+def project(X,
+            M,
+            mean=None,
+            out=None,
+            dtype=None,
+            block_size=None,
+            n_jobs=1):
+    """Project X with projection matrix M (i.e., X @ M or, with mean,
+    (X - mean) @ M) in row blocks so that memory-mapped X (e.g., np.load with
+    mmap_mode='r') is read block by block without a full in-memory copy.
+    Blocks can be projected in parallel with a thread pool and written into a
+    given (e.g., memory-mapped) output array.
+    Parameters
+    ----------
+    X: array-like of shape(n_samples, n_features)
+        Data.
+    M: numpy array of shape(n_features, n_components)
+        Projection matrix.
+    mean: None or array-like of shape (n_features,), optional, (default=None)
+        If provided, mean is subtracted from X before the projection. Each
+        block is centered separately, so only one block is copied at a time
+        (centering before the product also avoids cancellation errors of
+        X @ M - mean @ M with float32 and large means).
+    out: None or numpy array of shape(n_samples, n_components), optional,
+        (default=None)
+        If provided, the result is written into out (e.g., np.memmap or
+        np.lib.format.open_memmap for results larger than memory).
+    dtype: None or dtype, optional, (default=None)
+        dtype of computation and the result (e.g., np.float32 halves memory
+        and is usually faster). If None, out's dtype or the result type of
+        X and M.
+    block_size: None or int, optional, (default=None)
+        Number of rows projected at once. If None, a block size keeping each
+        block around DEFAULT_BLOCK_ELEMENTS elements is used.
+    n_jobs: None or int, optional, (default=1)
+        Number of threads projecting blocks. If None, the number of CPUs is
+        used.
+    Returns
+    -------
+    Z: numpy array of shape(n_samples, n_components)
+        out if provided.
+    """
+    if not isinstance(X, np.ndarray):
+        # e.g., lists and pandas DataFrames (memory-mapped arrays are
+        # ndarrays and kept as they are to read them block by block)
+        X = np.asarray(X)
+    n, d = X.shape
+    if dtype is None:
+        dtype = out.dtype if out is not None else np.result_type(
+            X.dtype, M.dtype)
+    M = np.asarray(M, dtype=dtype)
+    mean = None if mean is None else np.asarray(mean, dtype=dtype)
+    if block_size is None:
+        block_size = max(1, DEFAULT_BLOCK_ELEMENTS // max(d, 1))
+
+    if out is None:
+        if n <= block_size:
+            if mean is None:
+                return np.asarray(X, dtype=dtype) @ M
+            return (np.asarray(X, dtype=dtype) - mean) @ M
+        out = np.empty((n, M.shape[1]), dtype=dtype)
+    elif out.shape != (n, M.shape[1]):
+        raise ValueError(
+            f'out must have shape {(n, M.shape[1])}, but has {out.shape}')
+
+    def project_block(start):
+        end = min(start + block_size, n)
+        X_block = np.asarray(X[start:end], dtype=dtype)
+        if mean is not None:
+            X_block = X_block - mean
+        out[start:end] = X_block @ M
+
+    starts = range(0, n, block_size)
+    if n_jobs == 1:
+        for start in starts:
+            project_block(start)
+    else:
+        # numpy releases GIL during matrix products
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(project_block, starts))
+
+    return out
+
+
+def save_fitted(file,
+                model,
+                M,
+                alpha=None,
+                mean=None,
+                settings={},
+                final_cost=None):
+    """Save a fitted model in the .npz format.
+    Parameters
+    ----------
+    file: str, Path, or file-like object
+        Same with numpy.savez (.npz is appended to a file name without it).
+    model: str
+        Name of the model's class (e.g., 'EVDULCA').
+    M: array-like of shape (n_features, n_components)
+        Projection matrix.
+    alpha: None or float, optional, (default=None)
+        alpha of the model (if exists).
+    mean: None or array-like of shape (n_features,), optional, (default=None)
+        Mean of training data.
+    settings: dictionary, optional, (default={})
+        JSON-serializable parameters of the model's constructor.
+    final_cost: None or float, optional, (default=None)
+        Cost obtained by the fit (if not computed from alpha).
+    """
+    arrays = {
+        'model': np.array(model),
+        'settings': np.array(json.dumps(settings)),
+        'M': np.asarray(M)
+    }
+    for key, val in (('alpha', alpha), ('mean', mean), ('final_cost',
+                                                        final_cost)):
+        if val is not None:
+            arrays[key] = np.asarray(val, dtype=float)
+    np.savez(file, **arrays)
+
+
+def load_fitted(file):
+    """Load a fitted model saved with save_fitted.
+    Returns
+    -------
+    Dictionary with 'model', 'M', 'alpha', 'mean', 'settings', and
+    'final_cost' keys (same with save_fitted's parameters). Values not saved
+    are None.
+    """
+    with np.load(file) as f:
+        fitted = {
+            'model': str(f['model']),
+            'settings': json.loads(str(f['settings'])),
+            'M': f['M']
+        }
+        fitted['alpha'] = float(f['alpha']) if 'alpha' in f else None
+        fitted['mean'] = f['mean'] if 'mean' in f else None
+        fitted['final_cost'] = float(
+            f['final_cost']) if 'final_cost' in f else None
+
+    return fitted
+
+
+class Projection():
+    """Fitted linear projection loaded from a file saved by EVDULCA's or LDR
+    class's save (or save_fitted). Only transform is available, and pymanopt
+    is not required.
+    Parameters
+    ----------
+    M: array-like of shape (n_features, n_components)
+        Projection matrix.
+    alpha: None or float, optional, (default=None)
+        alpha of the fitted model.
+    mean: None or array-like of shape (n_features,), optional, (default=None)
+        Mean of training data.
+    model: None or str, optional, (default=None)
+        Name of the fitted model's class.
+    settings: dictionary, optional, (default={})
+        Parameters of the fitted model's constructor.
+    final_cost: None or float, optional, (default=None)
+        Cost obtained by the fit (if saved).
+    Attributes
+    ----------
+    M, alpha, mean, model, settings, final_cost: same with parameters.
+    n_components: int
+        Number of components.
+
+    Examples
+    --------
+    >>> # fit on one machine
+    >>> from ulca.ulca import EVDULCA
+    >>> ulca = EVDULCA(n_components=2).fit(X, y, w_tg, w_bg, w_bw)
+    >>> ulca.save('ulca_model.npz')
+
+    >>> # transform on other machines (pymanopt is not imported)
+    >>> from manopt_dr.projection import Projection
+    >>> Z = Projection.load('ulca_model.npz').transform(X_new)
+    """
+
+    def __init__(self,
+                 M,
+                 alpha=None,
+                 mean=None,
+                 model=None,
+                 settings={},
+                 final_cost=None):
+        self.M = np.asarray(M)
+        self.alpha = alpha
+        self.mean = None if mean is None else np.asarray(mean)
+        self.model = model
+        self.settings = settings
+        self.final_cost = final_cost
+
+    @property
+    def n_components(self):
+        return self.M.shape[1]
+
+    @classmethod
+    def load(cls, file):
+        """Load a fitted model saved with save_fitted.
+        Returns
+        -------
+        Projection instance.
+        """
+        fitted = load_fitted(file)
+        return cls(fitted['M'],
+                   alpha=fitted['alpha'],
+                   mean=fitted['mean'],
+                   model=fitted['model'],
+                   settings=fitted['settings'],
+                   final_cost=fitted['final_cost'])
+
+    def save(self, file):
+        """Save in the same format with the fitted model's save."""
+        save_fitted(file,
+                    self.model,
+                    self.M,
+                    alpha=self.alpha,
+                    mean=self.mean,
+                    settings=self.settings,
+                    final_cost=self.final_cost)
+
+    def transform(self,
+                  X,
+                  subtract_mean=False,
+                  out=None,
+                  dtype=None,
+                  n_jobs=1):
+        """Apply the projection to X (same with the fitted model's transform).
+        Parameters
+        ----------
+        X: array-like of shape(n_samples, n_features)
+            Data.
+        subtract_mean: bool, optional, (default=False)
+            If True, the mean of training data is subtracted from X.
+        out, dtype, n_jobs: optional
+            Same with project.
+        Returns
+        -------
+        X_new, ndarray of shape (n_samples, n_components)
+            Transformed values.
+        """
+        return project(X,
+                       self.M,
+                       mean=self.mean if subtract_mean else None,
+                       out=out,
+                       dtype=dtype,
+                       n_jobs=n_jobs)
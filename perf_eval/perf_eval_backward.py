@@ -9,36 +9,13 @@ from scipy.spatial.distance import pdist
 from sklearn.cluster import KMeans
 from sklearn.preprocessing import scale
 
-from ulca.ulca import ULCA
-from ulca_ui.utils.weight_opt import optimize_cost, total_cost
+from manopt_dr.group_stats import GroupStats
+from ulca.ulca import ULCA, EVDULCA
+from ulca_ui.utils.weight_opt import optimize_cost, resolve_method, total_cost
 
 
 def compute_covs(X, y):
-    labels = np.unique(y)
-    Covs = {}
-
-    X_c = X - X.mean(axis=0)
-
-    class_mean = {}
-    for label in labels:
-        class_mean[label] = X_c[y == label, :].mean(axis=0)
-
-    X_class_mean = np.zeros(X.shape)
-    for label in labels:
-        X_class_mean[y == label, :] = class_mean[label]
-
-    all_mean = 0  # this equals to X_c.mean()
-
-    for label in labels:
-        # to compute within-cov
-        WI = X_c[y == label, :] - X_class_mean[y == label, :]
-        # to compute between-cov
-        BW = X_class_mean[y == label, :] - all_mean
-        Cov_within = WI.T @ WI
-        Cov_between = BW.T @ BW
-        Covs[label] = {'within': Cov_within, 'between': Cov_between}
-
-    return Covs
+    return GroupStats.from_data(X, y)
 
 
 def run_perf_eval(n=100,
@@ -50,21 +27,19 @@ def run_perf_eval(n=100,
                   gamma0=1e-3,
                   gamma1=1e-3,
                   max_iter=10,
+                  opt_method='COBYLA',
                   file_prefix='./document_vec_',
                   return_details=False,
                   log_file='./log2.txt'):
-    X = np.load(f'{file_prefix}{d}.npy')
+    # memory-map to read only sampled rows from the file
+    X = np.load(f'{file_prefix}{d}.npy', mmap_mode='r')
 
-    # randomly sample rows
-    sampled_indices = sample(list(range(X.shape[0])), n)
+    # randomly sample rows (sorted to read the file sequentially)
+    sampled_indices = sorted(sample(list(range(X.shape[0])), n))
     X = X[sampled_indices, :]
 
     # assign labels based on k-means clustering
     y = KMeans(n_clusters=c).fit(X).labels_
-
-    print(
-        f'n:{n}, d:{d}, c:{c}, alpha:{alpha}, n_run:{n_runs}, max_iter:{max_iter}'
-    )
     X = scale(X)
 
     ulca = None
@@ -73,6 +48,19 @@ def run_perf_eval(n=100,
     else:
         ulca = EVDULCA(n_components=2, apply_varimax=False)
 
+    # optimize_cost replaces L-BFGS-B with COBYLA when the gradient is not
+    # available (e.g., manifold ULCA with apply_geom_trans=False). record the
+    # method actually used
+    opt_method = resolve_method(ulca,
+                                opt_method,
+                                with_alpha=True,
+                                alpha=alpha,
+                                apply_geom_trans=False)
+
+    print(
+        f'n:{n}, d:{d}, c:{c}, alpha:{alpha}, n_run:{n_runs}, max_iter:{max_iter}, opt_method:{opt_method}'
+    )
+
     # generate an initial result
     w_tg = np.random.rand(c)
     w_bg = np.random.rand(c)
@@ -218,7 +206,7 @@ def run_perf_eval(n=100,
                                         Z_prev=Z,
                                         apply_geom_trans=False,
                                         n_components=2,
-                                        method='COBYLA',
+                                        method=opt_method,
                                         options={'maxiter': max_iter})
                 end_time = time.perf_counter()
 
@@ -235,7 +223,7 @@ def run_perf_eval(n=100,
                                                       best_cost)
 
                 log_file.write(
-                    f'{d},{c},{max_iter},{i},{cost},{best_cost},{original_cost},{precision}\n'
+                    f'{d},{c},{max_iter},{opt_method},{i},{cost},{best_cost},{original_cost},{precision}\n'
                 )
 
                 if precision > 1:
@@ -256,14 +244,18 @@ def run_perf_eval(n=100,
     if return_details:
         return ave_time, ave_precision, var_time, var_precision, len(
             comp_time
-        ), comp_time, original_costs, best_costs, costs, precisions
+        ), opt_method, comp_time, original_costs, best_costs, costs, precisions
     else:
-        return ave_time, ave_precision, var_time, var_precision, len(comp_time)
+        return ave_time, ave_precision, var_time, var_precision, len(
+            comp_time), opt_method
 
 
 if __name__ == '__main__':
     n_runs = 500
-    method = 'manopt_ulca'
+    opt_method = 'COBYLA'  # or 'L-BFGS-B'
+    # L-BFGS-B (analytic gradient) is available for EVDULCA without varimax
+    # rotation (without the rotation to Z_prev as in run_perf_eval)
+    method = 'evd_ulca' if opt_method == 'L-BFGS-B' else 'manopt_ulca'
     alpha = 1
     gamma0 = 0
     gamma1 = 0
@@ -278,7 +270,7 @@ if __name__ == '__main__':
         for c in cs:
             for max_iter in max_iterations:
                 (ave_comp_time, ave_precision, var_time, var_precision,
-                 succeeded_runs) = run_perf_eval(n=n,
+                 succeeded_runs, used_opt_method) = run_perf_eval(n=n,
                                                  d=d,
                                                  c=c,
                                                  alpha=alpha,
@@ -286,11 +278,13 @@ if __name__ == '__main__':
                                                  n_runs=n_runs,
                                                  gamma0=gamma0,
                                                  gamma1=gamma1,
-                                                 max_iter=max_iter)
+                                                 max_iter=max_iter,
+                                                 opt_method=opt_method)
 
                 result.append({
                     'n_runs': n_runs,
                     'method': method,
+                    'opt_method': used_opt_method,
                     'alpha': alpha if alpha else 'auto',
                     'n': n,
                     'd': d,
@@ -0,0 +1,114 @@
+import time
+import numpy as np
+import pandas as pd
+from random import sample
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import scale
+
+from manopt_dr.group_stats import GroupStats
+from ulca.ulca import ULCA
+
+
+def run_perf_eval(n=100,
+                  d=10,
+                  c=3,
+                  alpha=1,
+                  n_runs=10,
+                  gamma0=1e-3,
+                  gamma1=1e-3,
+                  file_prefix='./document_vec_',
+                  return_details=False):
+    # compare manifold ULCA using autograd and closed-form derivatives
+    X = np.load(f'{file_prefix}{d}.npy', mmap_mode='r')
+
+    # randomly sample rows (sorted to read the file sequentially)
+    sampled_indices = sorted(sample(list(range(X.shape[0])), n))
+    X = X[sampled_indices, :]
+
+    # assign labels based on k-means clustering
+    y = KMeans(n_clusters=c).fit(X).labels_
+
+    print(f'n:{n}, d:{d}, c:{c}, alpha:{alpha}, n_run:{n_runs}')
+    X = scale(X)
+
+    # covariance computation is shared by both methods
+    Covs = GroupStats.from_data(X, y)
+
+    methods = {'autograd': True, 'analytic': False}
+    ulca = ULCA(n_components=2, apply_varimax=False, apply_consist_axes=False)
+
+    comp_time = {}
+    costs = {}
+    for method in methods:
+        comp_time[method] = []
+        costs[method] = []
+
+    for i in range(n_runs):
+        w_tg = np.random.rand(c)
+        w_bg = np.random.rand(c)
+        w_bw = np.random.rand(c)
+
+        # use the same initial point for both methods
+        init = np.linalg.qr(np.random.randn(d, 2))[0]
+        for method, use_autograd in methods.items():
+            start_time = time.perf_counter()
+            ulca.fit(X,
+                     y=y,
+                     w_tg=w_tg,
+                     w_bg=w_bg,
+                     w_bw=w_bw,
+                     Covs=Covs,
+                     alpha=alpha,
+                     gamma0=gamma0,
+                     gamma1=gamma1,
+                     init=init,
+                     use_autograd=use_autograd)
+            end_time = time.perf_counter()
+            comp_time[method].append(end_time - start_time)
+            costs[method].append(ulca.get_final_cost())
+
+    ave_time = {}
+    for method in methods:
+        ave_time[method] = np.mean(np.array(comp_time[method]))
+
+    print(f'ave comp time: {ave_time}')
+    if return_details:
+        return ave_time, comp_time, costs
+    else:
+        return ave_time
+
+
+if __name__ == '__main__':
+    n_runs = 10
+    c = 3
+    gamma0 = 0
+    gamma1 = 0
+    n = 1000
+
+    alphas = [1, None]  # None is ULCA without alpha (trace-ratio cost)
+    ds = [10, 50, 100, 500, 1000]
+
+    result = []
+    for alpha in alphas:
+        for d in ds:
+            ave_comp_time = run_perf_eval(n=n,
+                                          d=d,
+                                          c=c,
+                                          alpha=alpha,
+                                          gamma0=gamma0,
+                                          gamma1=gamma1,
+                                          n_runs=n_runs)
+
+            for method in ave_comp_time:
+                result.append({
+                    'n_runs': n_runs,
+                    'method': method,
+                    'alpha': alpha if alpha else 'auto',
+                    'n': n,
+                    'd': d,
+                    'c': c,
+                    'ave_comp_time': ave_comp_time[method]
+                })
+
+    result = pd.DataFrame(result)
+    result.to_csv('perf_eval_grad.csv', index=False)
@@ -21,10 +21,11 @@ def run_perf_eval(n=100,
                   gamma1=1e-3,
                   file_prefix='./document_vec_',
                   return_details=False):
-    X = np.load(f'{file_prefix}{d}.npy')
+    # memory-map to read only sampled rows from the file
+    X = np.load(f'{file_prefix}{d}.npy', mmap_mode='r')
 
-    # randomly sample rows
-    sampled_indices = sample(list(range(X.shape[0])), n)
+    # randomly sample rows (sorted to read the file sequentially)
+    sampled_indices = sorted(sample(list(range(X.shape[0])), n))
     X = X[sampled_indices, :]
 
     # assign labels based on k-means clustering
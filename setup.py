@@ -18,7 +18,10 @@ setup(name='ulca',
           'simple-websocket-server', 'factor-analyzer'
       ],
       py_modules=[
-          'manopt_dr', 'manopt_dr.core', 'manopt_dr.predefined_func_generator',
+          'manopt_dr', 'manopt_dr.core', 'manopt_dr.group_stats',
+          'manopt_dr.predefined_func_generator', 'manopt_dr.projection',
           'ulca', 'ulca.ulca', 'ulca_ui', 'ulca_ui.plot', 'ulca_ui.utils',
-          'ulca_ui.utils.weight_opt', 'ulca_ui.utils.geom_trans'
+          'ulca_ui.utils.weight_opt', 'ulca_ui.utils.geom_trans',
+          'ulca_ui.utils.fit_cache', 'ulca_ui.utils.transport',
+          'ulca_ui.utils.result_store'
       ])
@@ -1,13 +1,23 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from scipy import linalg
+from scipy.sparse import linalg as sparse_linalg
 
 from factor_analyzer import Rotator
 
 from manopt_dr.core import gen_ldr
-from manopt_dr.predefined_func_generator import gen_cost_ulca, gen_default_proj
+from manopt_dr.group_stats import GroupStats
+from manopt_dr.projection import save_fitted, load_fitted
+from manopt_dr.predefined_func_generator import (
+    gen_cost_ulca,
+    gen_default_proj,
+    precompute_ulca,
+)
 
 # ULCA class
-ULCA = gen_ldr(gen_cost_ulca, gen_default_proj)
+ULCA = gen_ldr(gen_cost_ulca, gen_default_proj, precompute_func=precompute_ulca)
 
 # alias of ULCA
 MANOPTULCA = ULCA
@@ -30,10 +40,16 @@ apply_consist_axes: bool, optional, (default=True)
 verbosity: int, optional, (default=0)
     Level of information logged by the solver while it operates, 0 is
     silent, 2 is most information. Refer to https://www.pymanopt.org/.
+warm_start: bool, optional, (default=False)
+    If True, fit starts the optimization from the previous optimized
+    projection matrix (M_opt). Useful for consecutive fits with slightly
+    different weights (e.g., interactive updates in UI). An initial point can
+    be also given to fit with init keyword argument.
 
 Methods (same with EVDULCA. See EVDULCA's methods)
 ----------
 fit
+fit_many (weights_list is given as params_list)
 transform
 fit_transform
 get_final_cost
@@ -53,12 +69,17 @@ solver: Pymanopt solver class
     Solver class used for solving manifold optimization problem.
 M: numpy array, shape(n_features, n_components)
     Projection matrix.
+M_opt: numpy array, shape(n_features, n_components)
+    Projection matrix obtained by the solver before varimax rotation and
+    adjustment of axes.
 apply_varimax: bool
     Applying varimax rotation to the obtained components or not.
 apply_consist_axes:
     Applying adjustment of signs of axes and order of axes or not.
 verbosity: int
     Level of information logged.
+warm_start: bool
+    Starting the optimization from the previous M_opt or not.
 """
 
 
@@ -78,24 +99,161 @@ class EVDULCA:
     verbosity: int, optional, (default=0)
         Level of information logged by the solver while it operates, 0 is
         silent, the other number is providing information.
+    evd_solver: str, optional, (default="auto")
+        Eigensolver used to obtain the top n_components eigenvectors of the
+        symmetric matrix in Eq. 9.
+        - "eigh": scipy.linalg.eigh computing only the top n_components
+          eigenpairs.
+        - "lanczos": scipy.sparse.linalg.eigsh (Lanczos method), which can be
+          faster for a large number of features when the top eigenvalues are
+          well separated. When alpha is automatically selected, it is
+          warm-started from the eigenvectors of the previous iteration.
+        - "eig": scipy.linalg.eig (general eigensolver; slow).
+        - "auto": currently "eigh".
+    Attributes
+    ----------
+    M: numpy array, shape(n_features, n_components)
+        Projection matrix.
+    alpha: float
+        alpha used for (or automatically selected by) the last fit.
+    n_iter: int
+        Number of eigenvalue decompositions performed by the last fit.
+    mean: numpy array, shape(n_features,)
+        Mean of training data (stored for saving and transforming new data).
     """
 
     def __init__(
-        self, n_components=2, apply_varimax=False, apply_consist_axes=True, verbosity=0
+        self,
+        n_components=2,
+        apply_varimax=False,
+        apply_consist_axes=True,
+        verbosity=0,
+        evd_solver="auto",
     ):
         self.n_components = n_components
         self.M = None
         self.alpha = None
-        self.project_func_generator = lambda M: (lambda X: X @ M)
+        self.project_func_generator = gen_default_proj
         self.projector = None
         self.apply_varimax = apply_varimax
         self.apply_consist_axes = apply_consist_axes
         self.verbosity = verbosity
+        self.evd_solver = evd_solver
+        self.n_iter = None
+        self.group_stats = None
+        self.mean = None
+        self._covs_buffer = None
+
+    def __getstate__(self):
+        # the buffer reused across refits is not a part of the fitted model
+        # and is not copied (e.g., by copy.deepcopy). neither are the
+        # statistics accumulated by partial_fit (n_labels x d x d scatters,
+        # much larger than the fitted model). the projector (a closure)
+        # cannot be pickled and is regenerated from M in __setstate__
+        state = self.__dict__.copy()
+        state["_covs_buffer"] = None
+        state["group_stats"] = None
+        state["projector"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.M is not None:
+            self.projector = self.project_func_generator(self.M)
+
+    def _settings(self):
+        return {
+            "n_components": self.n_components,
+            "apply_varimax": self.apply_varimax,
+            "apply_consist_axes": self.apply_consist_axes,
+            "verbosity": self.verbosity,
+            "evd_solver": self.evd_solver,
+        }
+
+    def save(self, file):
+        """Save the fitted model (M, alpha, mean, and parameters of the
+        constructor) in the .npz format. The saved model can be loaded with
+        EVDULCA.load or, without pymanopt, with manopt_dr.projection.Projection.
+        Parameters
+        ----------
+        file: str, Path, or file-like object
+            Same with numpy.savez (.npz is appended to a file name without it).
+        """
+        save_fitted(
+            file,
+            type(self).__name__,
+            self.M,
+            alpha=self.alpha,
+            mean=self.mean,
+            settings=self._settings(),
+        )
+
+    @classmethod
+    def load(cls, file):
+        """Load a fitted model saved with save.
+        Parameters
+        ----------
+        file: str, Path, or file-like object
+            Same with numpy.load.
+        Returns
+        -------
+        EVDULCA instance.
+        """
+        fitted = load_fitted(file)
+        dr = cls(**fitted["settings"])
+        dr.alpha = fitted["alpha"]
+        dr.mean = fitted["mean"]
+        return dr.update_projector(fitted["M"])
 
-    def _apply_evd(self, C0, C1, alpha):
+    def _apply_evd(self, C0, C1, alpha, M_init=None):
         C = C0 - alpha * C1
-        w, v = linalg.eig(C)
-        return v[:, np.argsort(-np.real(w))[: self.n_components]]
+        d = C.shape[0]
+        k = self.n_components
+
+        evd_solver = self.evd_solver
+        if evd_solver == "auto":
+            evd_solver = "eigh"
+        if evd_solver == "lanczos" and k >= d - 1:
+            # ARPACK can compute at most d - 2 eigenpairs
+            evd_solver = "eigh"
+
+        if evd_solver == "eigh":
+            # C is symmetric; compute only the top-k eigenpairs
+            w, v = linalg.eigh(C, subset_by_index=[d - k, d - 1])
+        elif evd_solver == "lanczos":
+            # warm start from the previous eigenvectors if available
+            v0 = None if M_init is None else M_init.sum(axis=1)
+            w, v = sparse_linalg.eigsh(C, k=k, which="LA", v0=v0)
+        elif evd_solver == "eig":
+            w, v = linalg.eig(C)
+            w, v = np.real(w), np.real(v)
+        else:
+            raise ValueError(f"Unknown evd_solver: {self.evd_solver}")
+
+        return v[:, np.argsort(-w)[:k]]
+
+    def _solve_trace_ratio(self, C0, C1, convergence_ratio=1e-2, max_iter=100):
+        # Newton (Dinkelbach) iteration for the trace-ratio problem (Eq. 10 and
+        # 11). f(alpha) = max_M tr(M^T (C0 - alpha C1) M) has the derivative
+        # -tr(M^T C1 M), so the Newton step is alpha <- tr(M^T C0 M) /
+        # tr(M^T C1 M), which converges superlinearly. Iteration starts from
+        # tr(C0) / tr(C1), a lower bound of the optimal alpha, and stops when
+        # the Newton step becomes small. The returned alpha is the trace ratio
+        # achieved by the returned M (no extra EVD is needed after convergence).
+        alpha = np.trace(C0) / np.trace(C1)
+        M = None
+        for n_iter in range(1, max_iter + 1):
+            M = self._apply_evd(C0, C1, alpha, M_init=M)
+            next_alpha = np.trace(M.T @ C0 @ M) / np.trace(M.T @ C1 @ M)
+
+            improved_ratio = np.abs(next_alpha - alpha) / np.abs(next_alpha)
+            if self.verbosity > 0:
+                print(f"alpha: {alpha}, improved: {improved_ratio}")
+            alpha = next_alpha
+            if improved_ratio < convergence_ratio:
+                break
+
+        return M, alpha, n_iter
 
     def fit(
         self,
@@ -115,10 +273,11 @@ class EVDULCA:
         """Fit the model with X and other parameters.
         Parameters
         ----------
-        X: array-like of shape(n_samples, n_features)
-            Training data.
-        y: array-like of shape (n_samples,)
-            Labels of training data's instances.
+        X: array-like of shape(n_samples, n_features) or None
+            Training data. Can be None when Covs is GroupStats.
+        y: array-like of shape (n_samples,) or None
+            Labels of training data's instances. Can be None when Covs is
+            GroupStats.
         w_tg: array-like of shape (n_groups,) or dictionary
             Target weights assigned for each group's covariance matrix.
             If array is used, array element of y must be integer.
@@ -139,11 +298,13 @@ class EVDULCA:
             correspondence.
             Each weight should be a range of [0, 1].
             (e.g., y = [0, 1, 1, 0], w_bw={0: 0.1, 1: 0.5})
-        Covs: dictionary, optional, (default={})
+        Covs: GroupStats or dictionary, optional, (default={})
             If provided, computation of within-group and between-group
             covariance matrices will be skipped.
-            Use 'within' and 'between' keys to assign within-group and
-            between-group covariance matrixes.
+            GroupStats computed once with GroupStats.from_data(X, y) can be
+            reused across multiple fits.
+            When dictionary is used, use 'within' and 'between' keys to assign
+            within-group and between-group covariance matrixes.
             (e.g., Covs={'within': Cov_wi, 'between': Cov_bt})
         alpha: None or float, optional (default=None)
             If None, alpha is automatically selected by solving Eq. 6 in
@@ -197,50 +358,41 @@ class EVDULCA:
         """
         self.alpha = alpha
 
-        labels = np.unique(y)
-        _Covs = {}
-
         # when Covs are provided, covariance computation here will be skipped
-        if len(Covs.keys()) == 0:
-            if centering:
-                X_c = X - X.mean(axis=0)
-
-            class_mean = {}
-            for label in labels:
-                class_mean[label] = X_c[y == label, :].mean(axis=0)
-
-            X_class_mean = np.zeros(X.shape)
-            for label in labels:
-                X_class_mean[y == label, :] = class_mean[label]
-
-            all_mean = 0  # this equals to X_c.mean()
+        if isinstance(Covs, GroupStats):
+            stats = Covs
+        elif len(Covs.keys()) == 0:
+            stats = GroupStats.from_data(X, y)
+        else:
+            stats = None
 
+        if stats is None:
+            labels = np.unique(y)
+            d = Covs[labels[0]]["within"].shape[0]
+            self.mean = None if X is None else np.asarray(X).mean(axis=0)
+        else:
+            labels = stats.labels
+            d = stats.n_features
+            self.mean = stats.mean
+
+        # reuse buffers of C0 and C1 across refits
+        if self._covs_buffer is None or self._covs_buffer.shape != (2, d, d):
+            self._covs_buffer = np.empty((2, d, d))
+        if stats is None:
+            self._covs_buffer[:] = 0
             for label in labels:
-                # to compute within-cov
-                WI = X_c[y == label, :] - X_class_mean[y == label, :]
-                # to compute between-cov
-                BW = X_class_mean[y == label, :] - all_mean
-                Cov_within = WI.T @ WI
-                Cov_between = BW.T @ BW
-                _Covs[label] = {"within": Cov_within, "between": Cov_between}
+                self._covs_buffer[0] += w_tg[label] * Covs[label]["within"]
+                self._covs_buffer[0] += w_bw[label] * Covs[label]["between"]
+                self._covs_buffer[1] += w_bg[label] * Covs[label]["within"]
         else:
-            _Covs = Covs
-
-        _, d = X.shape
-        Cov_within_tg = np.zeros((d, d))
-        Cov_within_bg = np.zeros((d, d))
-        Cov_between = np.zeros((d, d))
-        w_tg_total = 0
-        w_bg_total = 0
-        w_bw_total = 0
-
-        for label in labels:
-            Cov_within_tg += w_tg[label] * _Covs[label]["within"]
-            Cov_within_bg += w_bg[label] * _Covs[label]["within"]
-            Cov_between += w_bw[label] * _Covs[label]["between"]
-            w_tg_total += w_tg[label]
-            w_bg_total += w_bg[label]
-            w_bw_total += w_bw[label]
+            stats.weighted_covs(
+                w_tg, w_bg, w_bw, centering=centering, out=self._covs_buffer
+            )
+        C0, C1 = self._covs_buffer
+
+        w_tg_total = sum(w_tg[label] for label in labels)
+        w_bg_total = sum(w_bg[label] for label in labels)
+        w_bw_total = sum(w_bw[label] for label in labels)
 
         if gamma0 is None:
             if w_tg_total + w_bw_total == 0:
@@ -253,30 +405,18 @@ class EVDULCA:
             else:
                 gamma1 = 0
 
-        C0 = Cov_within_tg + Cov_between + gamma0 * np.identity(d)
-        C1 = Cov_within_bg + gamma1 * np.identity(d)
+        C0[np.diag_indices(d)] += gamma0
+        C1[np.diag_indices(d)] += gamma1
 
         if self.alpha:
             self.M = self._apply_evd(C0, C1, self.alpha)
+            self.n_iter = 1
             if self.apply_varimax and self.n_components > 1:
                 self.M = Rotator(method="varimax").fit_transform(self.M)
         else:
-            self.alpha = 0
-            self.M = self._apply_evd(C0, C1, self.alpha)
-            iter = 1
-            improved_ratio = 1
-            for i in range(max_iter):
-                prev_alpha = self.alpha
-                self.alpha = np.trace(self.M.T @ C0 @ self.M) / np.trace(
-                    self.M.T @ C1 @ self.M
-                )
-                self.M = self._apply_evd(C0, C1, self.alpha)
-
-                improved_ratio = np.abs(prev_alpha - self.alpha) / self.alpha
-                if self.verbosity > 0:
-                    print(f"alpha: {self.alpha}, improved: {improved_ratio}")
-                if improved_ratio < convergence_ratio:
-                    break
+            self.M, self.alpha, self.n_iter = self._solve_trace_ratio(
+                C0, C1, convergence_ratio=convergence_ratio, max_iter=max_iter
+            )
 
             if self.apply_varimax and self.n_components > 1:
                 self.M = Rotator(method="varimax").fit_transform(self.M)
@@ -290,20 +430,178 @@ class EVDULCA:
 
         return self
 
-    def transform(self, X):
+    def partial_fit(self, X, y):
+        """Accumulate per-label statistics of a chunk of training data.
+        This can be used for data that does not fit in memory. After all
+        chunks are given, call finalize to solve ULCA from the accumulated
+        statistics. Accumulated statistics are stored in self.group_stats
+        (set self.group_stats = None to restart the accumulation). They are
+        not included when the model is pickled or copied with copy.deepcopy;
+        to keep them, save self.group_stats separately (e.g., with
+        ResultStore.save_group_stats of ulca_ui.utils.result_store).
+        Parameters
+        ----------
+        X: array-like of shape(n_samples, n_features)
+            Chunk of training data.
+        y: array-like of shape (n_samples,)
+            Labels of the chunk's instances.
+        Returns
+        -------
+        self.
+
+        Examples
+        -------
+        >>> ulca = EVDULCA(n_components=2)
+        >>> for X_chunk, y_chunk in chunks:
+        ...     ulca = ulca.partial_fit(X_chunk, y_chunk)
+        >>> ulca = ulca.finalize(w_tg=w_tg, w_bg=w_bg, w_bw=w_bw)
+        """
+        if self.group_stats is None:
+            self.group_stats = GroupStats.from_data(X, y)
+        else:
+            self.group_stats.update(X, y)
+
+        return self
+
+    def finalize(
+        self,
+        w_tg,
+        w_bg,
+        w_bw,
+        alpha=None,
+        centering=True,
+        gamma0=None,
+        gamma1=None,
+        convergence_ratio=1e-2,
+        max_iter=100,
+    ):
+        """Fit the model with the statistics accumulated by partial_fit.
+        Can be called multiple times with different parameters (but not on a
+        pickled or deep-copied model, which does not keep the statistics).
+        Parameters
+        ----------
+        w_tg, w_bg, w_bw, alpha, centering, gamma0, gamma1, convergence_ratio,
+        max_iter:
+            Same with fit.
+
+        Returns
+        -------
+        self.
+        """
+        if self.group_stats is None:
+            raise ValueError("partial_fit must be called before finalize")
+
+        return self.fit(
+            None,
+            None,
+            w_tg=w_tg,
+            w_bg=w_bg,
+            w_bw=w_bw,
+            Covs=self.group_stats,
+            alpha=alpha,
+            centering=centering,
+            gamma0=gamma0,
+            gamma1=gamma1,
+            convergence_ratio=convergence_ratio,
+            max_iter=max_iter,
+        )
+
+    def fit_many(
+        self,
+        X,
+        y,
+        weights_list,
+        Covs={},
+        n_jobs=None,
+        return_alphas=False,
+        **kwargs,
+    ):
+        """Fit the model for many weight configurations over the same X and y.
+        Group statistics are computed only once and each configuration is
+        solved in parallel with a thread pool. self is not updated.
+        Parameters
+        ----------
+        X: array-like of shape(n_samples, n_features) or None
+            Training data. Can be None when Covs is GroupStats.
+        y: array-like of shape (n_samples,) or None
+            Labels of training data's instances. Can be None when Covs is
+            GroupStats.
+        weights_list: list of dictionaries
+            Each dictionary has w_tg, w_bg, w_bw, and optionally alpha (or any
+            other keyword arguments of fit) for one configuration.
+            (e.g., [{'w_tg': w_tg1, 'w_bg': w_bg1, 'w_bw': w_bw1, 'alpha': 1},
+                    {'w_tg': w_tg2, 'w_bg': w_bg2, 'w_bw': w_bw2}])
+        Covs: GroupStats or dictionary, optional, (default={})
+            Same with fit.
+        n_jobs: None or int, optional, (default=None)
+            Number of threads. If None, the number of CPUs is used.
+        return_alphas: bool, optional, (default=False)
+            If True, alpha used for (or selected by) each configuration is also
+            returned.
+        kwargs: keyword arguments
+            Other keyword arguments of fit shared by all configurations
+            (e.g., centering, gamma0, gamma1).
+        Returns
+        -------
+        Ms: ndarray of shape (n_configs, n_features, n_components)
+            Projection matrices.
+        alphas: ndarray of shape (n_configs,)
+            Only returned when return_alphas is True.
+        """
+        if not isinstance(Covs, GroupStats) and len(Covs.keys()) == 0:
+            Covs = GroupStats.from_data(X, y)
+
+        def fit_one(weights):
+            dr = copy.copy(self)
+            dr._covs_buffer = None
+            dr.fit(X, y, Covs=Covs, **{**kwargs, **weights})
+            return dr.M, dr.alpha
+
+        if n_jobs == 1:
+            results = [fit_one(weights) for weights in weights_list]
+        else:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                results = list(executor.map(fit_one, weights_list))
+
+        Ms = np.array([M for M, _ in results])
+        if return_alphas:
+            return Ms, np.array([alpha for _, alpha in results])
+        else:
+            return Ms
+
+    def transform(self, X, subtract_mean=False, out=None, dtype=None, n_jobs=1):
         """
         Apply dimensionality reduction to X.
         X is projected on the components previously extracted from a training set.
+        X is projected in row blocks (refer to manopt_dr.projection.project).
         Parameters
         ----------
         X: array-like of shape(n_samples, n_features)
             Data.
+        subtract_mean: bool, optional, (default=False)
+            If True, the mean of training data (mean) is subtracted from X
+            before the projection.
+        out: None or numpy array of shape(n_samples, n_components), optional,
+            (default=None)
+            If provided, the result is written into out (e.g., np.memmap).
+        dtype: None or dtype, optional, (default=None)
+            dtype of computation and the result (e.g., np.float32). If None,
+            out's dtype or the result type of X and M.
+        n_jobs: None or int, optional, (default=1)
+            Number of threads projecting row blocks. If None, the number of
+            CPUs is used.
         Returns
         -------
         X_new, ndarray of shape (n_samples, n_components)
             Transformed values.
         """
-        return self.projector(X)
+        return self.projector(
+            X,
+            mean=self.mean if subtract_mean else None,
+            out=out,
+            dtype=dtype,
+            n_jobs=n_jobs,
+        )
 
     def fit_transform(
         self,
@@ -347,11 +645,13 @@ class EVDULCA:
             correspondence.
             Each weight should be a range of [0, 1].
             (e.g., y = [0, 1, 1, 0], w_bw={0: 0.1, 1: 0.5})
-        Covs: dictionary, optional, (default={})
+        Covs: GroupStats or dictionary, optional, (default={})
             If provided, computation of within-group and between-group
             covariance matrices will be skipped.
-            Use 'within' and 'between' keys to assign within-group and
-            between-group covariance matrixes.
+            GroupStats computed once with GroupStats.from_data(X, y) can be
+            reused across multiple fits.
+            When dictionary is used, use 'within' and 'between' keys to assign
+            within-group and between-group covariance matrixes.
             (e.g., Covs={'within': Cov_wi, 'between': Cov_bt})
         alpha: None or float, optional (default=None)
             If None, alpha is automatically selected by solving Eq. 6 in
@@ -6,6 +6,7 @@ __URL__ = "https://bitbucket.org/anon-sub/ulca/src/master/"
 import sys
 
 __all__ = [
-    'plot', 'plot.utils.weight_opt', 'plot.utils.geom_trans', '__author__',
-    '__copyright__', '__license__', '__URL__'
+    'plot', 'plot.utils.weight_opt', 'plot.utils.geom_trans',
+    'plot.utils.fit_cache', 'plot.utils.transport', 'plot.utils.result_store',
+    '__author__', '__copyright__', '__license__', '__URL__'
 ]
@@ -1,9 +1,12 @@
 import copy
 import json
 import threading
+import traceback
 import webbrowser
+from collections import OrderedDict
+from urllib.parse import parse_qs, quote, urlparse
 import numpy as np
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum
 from pathlib import Path
 from http.server import HTTPServer, SimpleHTTPRequestHandler
@@ -12,8 +15,12 @@ from IPython.display import IFrame
 from simple_websocket_server import WebSocketServer, WebSocket
 from scipy.spatial.distance import pdist
 
+from manopt_dr.group_stats import GroupStats
 from ulca_ui.utils.weight_opt import optimize_cost
+from ulca_ui.utils.fit_cache import FitCache
 from ulca_ui.utils.geom_trans import find_best_rotate
+from ulca_ui.utils.transport import encode_binary, decode_binary
+from ulca_ui.utils.result_store import ResultStore
 
 
 class Info():
@@ -32,6 +39,14 @@ class Info():
         self.w_area = {'move': 0.5, 'scale': 0.5},
         self.w_dist = {'move': 0.5, 'scale': 0.5}
         self.weight_opt_max_iter = 0
+        self.weight_opt_method = 'COBYLA'
+        self.weight_opt_n_starts = 1
+        self.weight_opt_time_budget = None
+        self.weight_opt_n_jobs = None
+        self.binary_transport = True
+        self.quantize_emb_deltas = False
+        self.sample_indices = None
+        self.density_grid_size = 64
         self.feat_names = None
         self.y_to_name = None
         self.new_comp = {}
@@ -61,14 +76,15 @@ class Info():
         for key in self.y_to_name:
             label_to_name[int(key)] = str(self.y_to_name[key])
 
+        # feature values are not included and sent only when requested
+        # (refer to WsHandler._feat_vals)
         Z = self.dr.transform(self.X)
-        df_emb = pd.DataFrame({
-            'x': Z[:, 0],
-            'y': Z[:, 1],
-            'label': self.y,
-            'feat_vals': self.X.tolist()
-        })
-        emb = json.loads(df_emb.to_json(orient='records'))
+        Z_shown = self._sample(Z)
+        emb = {
+            'x': Z_shown[:, 0],
+            'y': Z_shown[:, 1],
+            'label': self._sample(np.asarray(self.y))
+        }
 
         data = {
             'weights': weights,
@@ -86,12 +102,180 @@ class Info():
             },
             'label_to_name': label_to_name
         }
+        data.update(self._emb_summary(Z))
 
         return data
 
+    def snapshot(self):
+        """Copy of this info for saving and loading results. Data (X, y,
+        Covs, etc.) is not changed in UI and is shared with the copy, and only
+        the small parts (weights, alpha, fitted model, etc.) are copied.
+        Returns
+        -------
+        Info class instance.
+        """
+        shared = (self.X, self.y, self.Covs, self.feat_names, self.y_to_name,
+                  self.sample_indices)
+        memo = {id(obj): obj for obj in shared if obj is not None}
+
+        return copy.deepcopy(self, memo)
+
+    def _sample(self, A):
+        # rows of A shown in UI (all rows or the ones sampled in the
+        # level-of-detail mode)
+        return A if self.sample_indices is None else A[self.sample_indices]
+
+    def _emb_summary(self, Z):
+        # in the level-of-detail mode, statistics for confidence ellipses
+        # and density grids are computed from all instances
+        if self.sample_indices is None:
+            return {}
+
+        labels, label_index = np.unique(self.y, return_inverse=True)
+        c = len(labels)
+        counts = np.bincount(label_index, minlength=c)
+        means = np.column_stack([
+            np.bincount(label_index, weights=Z[:, i], minlength=c)
+            for i in range(2)
+        ]) / counts[:, None]
+        D = Z[:, :2] - means[label_index]
+        var_x, var_y, var_xy = [
+            np.bincount(label_index, weights=w, minlength=c) / counts
+            for w in (D[:, 0]**2, D[:, 1]**2, D[:, 0] * D[:, 1])
+        ]
+        emb_stats = [{
+            'label': int(labels[k]),
+            'n': int(counts[k]),
+            'meanX': float(means[k, 0]),
+            'meanY': float(means[k, 1]),
+            'varX': float(var_x[k]),
+            'varY': float(var_y[k]),
+            'varXY': float(var_xy[k])
+        } for k in range(c)]
+
+        # counts of instances of each label in grid_size x grid_size bins
+        # (ordered by label, row (y), and column (x))
+        grid_size = self.density_grid_size
+        mins = Z[:, :2].min(axis=0)
+        maxs = Z[:, :2].max(axis=0)
+        widths = np.where(maxs > mins, maxs - mins, 1)
+        bins = np.minimum(((Z[:, :2] - mins) / widths * grid_size).astype(int),
+                          grid_size - 1)
+        cells = (label_index * grid_size + bins[:, 1]) * grid_size + bins[:, 0]
+        density = {
+            'labels': [int(label) for label in labels],
+            'size': grid_size,
+            'x_range': [float(mins[0]), float(maxs[0])],
+            'y_range': [float(mins[1]), float(maxs[1])],
+            'counts': np.bincount(cells, minlength=c * grid_size**2).astype(
+                np.int32)
+        }
+
+        return {'emb_stats': emb_stats, 'density': density}
+
+
+class Session():
+    """State of one analysis shown in UI (dataset, fitted model, saved
+    results, cache of fits, and compute worker). Sessions share the HTTP and
+    WebSocket servers, and UI selects its session with the session id in the
+    page URL (e.g., http://localhost:8000/?session=alice).
+    Parameters
+    ----------
+    session_id: str
+        Session id.
+    """
 
-info = Info()
-saved_info = {}
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.info = Info()
+        self.saved_info = {}
+        # projection matrices fitted in the UI and the weight optimization
+        self.fit_cache = FitCache()
+        # worker running actions of UI (fits, optimizations, etc.) outside of
+        # WebSocket server's loop. a single worker per session keeps the order
+        # of actions, avoids concurrent updates of info, and prevents a long
+        # action of one session from blocking the other sessions
+        self.compute_worker = ThreadPoolExecutor(max_workers=1)
+        # sequence number and cancellation event of the latest request
+        # updating the embedding (updateEmb and optimizeWeights). when a newer
+        # request arrives, older ones are dropped if not started yet, or
+        # cancelled if running
+        self.emb_request = {'seq': 0, 'cancel_event': threading.Event()}
+        self.emb_request_lock = threading.Lock()
+        # WebSocket clients connected to this session
+        self.clients = set()
+        # on-disk store of saved results (optional) and the key of the data
+        self.store = None
+        self.dataset_key = None
+
+    def result_names(self):
+        # names of saved results (the ones only in the store first)
+        names = list(self.saved_info)
+        if self.store is None:
+            return names
+        return [
+            name for name in self.store.result_names(self.dataset_key)
+            if name not in self.saved_info
+        ] + names
+
+    def save_result(self, name):
+        self.saved_info[name] = self.info.snapshot()
+        if self.store is not None:
+            info = self.info
+            self.store.save_result(self.dataset_key, name, info.dr.M,
+                                   info.alpha, info.w_tg, info.w_bg,
+                                   info.w_bw)
+
+    def saved_result(self, name):
+        # saved result in memory or, if not loaded yet, in the store
+        if name not in self.saved_info and self.store is not None:
+            result = self.store.load_result(self.dataset_key, name)
+            if result is not None:
+                info = self.saved_info.get('-', self.info).snapshot()
+                info.w_tg = result['w_tg']
+                info.w_bg = result['w_bg']
+                info.w_bw = result['w_bw']
+                info.alpha = result['alpha']
+                info.dr.update_projector(result['M'])
+                if hasattr(info.dr, 'alpha'):
+                    info.dr.alpha = result['alpha']
+                self.saved_info[name] = info
+
+        return self.saved_info[name]
+
+    def new_emb_request(self, seq=None):
+        # register a request updating the embedding and cancel older ones.
+        # seq is given by the client (if not, numbered here)
+        with self.emb_request_lock:
+            self.emb_request['cancel_event'].set()
+            self.emb_request['seq'] = self.emb_request[
+                'seq'] + 1 if seq is None else seq
+            self.emb_request['cancel_event'] = threading.Event()
+
+            return self.emb_request['seq'], self.emb_request['cancel_event']
+
+    def close(self):
+        # cancel running actions and disconnect clients
+        self.emb_request['cancel_event'].set()
+        for client in list(self.clients):
+            client.close()
+        self.compute_worker.shutdown(wait=False)
+
+
+# session used when the page URL does not have a session id
+DEFAULT_SESSION_ID = 'default'
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(session_id=DEFAULT_SESSION_ID, create=False):
+    """Return the session with session_id. If create is True, the session is
+    created when it does not exist. Otherwise, None is returned.
+    """
+    with sessions_lock:
+        if create and session_id not in sessions:
+            sessions[session_id] = Session(session_id)
+        return sessions.get(session_id)
 
 
 class Message(IntEnum):
@@ -101,6 +285,8 @@ class Message(IntEnum):
     loadResult = 3
     initialLoad = 4
     addNewComp = 5
+    featVals = 6
+    resync = 7
 
     @property
     def key(self):
@@ -116,6 +302,10 @@ class Message(IntEnum):
             return 'initialLoad'
         elif self == Message.addNewComp:
             return 'addNewComp'
+        elif self == Message.featVals:
+            return 'featVals'
+        elif self == Message.resync:
+            return 'resync'
 
     @property
     def label(self):
@@ -131,14 +321,128 @@ class Message(IntEnum):
             return 'initialLoad'
         elif self == Message.addNewComp:
             return 'addNewComp'
+        elif self == Message.featVals:
+            return 'featVals'
+        elif self == Message.resync:
+            return 'resync'
+
+
+def _encode_message(message, binary_transport=True):
+    # numpy arrays in message (e.g., embedding positions) are sent as binary
+    # buffers or, with the JSON fallback, as lists (embedding as records)
+    if binary_transport:
+        return encode_binary(message)
+
+    content = message['content']
+    if 'emb' in content:
+        keys = list(content['emb'])
+        content['emb'] = [
+            dict(zip(keys, vals))
+            for vals in zip(*[content['emb'][key].tolist() for key in keys])
+        ]
+
+    return json.dumps(message, default=lambda obj: obj.tolist())
+
+
+def _quantize_delta(Z, Z_prev):
+    # differences of positions quantized to int16. the client adds
+    # step * (quantized differences) to the positions it shows (Z_prev)
+    delta = Z[:, :2] - Z_prev
+    max_abs = np.abs(delta).max() if delta.size > 0 else 0
+    step = max_abs / np.iinfo(np.int16).max if max_abs > 0 else 1.0
+    q = np.round(delta / step).astype(np.int16)
+
+    return {'x': q[:, 0], 'y': q[:, 1], 'step': float(step)}
+
+
+def _stratified_sample(y, n_samples, random_state=0):
+    # indices of instances sampled from each label in proportion to the label's
+    # size (at least one instance from each label)
+    rng = np.random.default_rng(random_state)
+    labels, label_index, counts = np.unique(y,
+                                            return_inverse=True,
+                                            return_counts=True)
+    n_per_label = np.minimum(
+        counts, np.maximum(1, np.round(counts * n_samples / len(y)).astype(int)))
+    indices = [
+        rng.choice(np.flatnonzero(label_index == k), n, replace=False)
+        for k, n in enumerate(n_per_label)
+    ]
+
+    return np.sort(np.concatenate(indices))
+
+
+def _prev_emb(data):
+    # x and y positions of the embedding shown in UI (records in JSON
+    # messages or arrays in binary messages)
+    emb = data['emb']
+    if isinstance(emb, dict):
+        return np.column_stack((emb['x'], emb['y']))
+
+    return np.array([[d['x'], d['y']] for d in emb]).reshape(-1, 2)
 
 
 class WsHandler(WebSocket):
+    # fields of updates sent only when changed from the client's state
+    delta_fields = ('weights', 'bounds', 'max_upper_bound', 'components')
+    # number of recently sent states kept for each client (the client may
+    # ignore stale updates and its state can be older than the last one)
+    n_kept_states = 8
+
+    def _register_state(self, data):
+        # keep the state sent to this client and return its id
+        if not hasattr(self, 'sent_states'):
+            self.sent_states = OrderedDict()
+            self.last_state_id = 0
+        self.last_state_id += 1
+        self.sent_states[self.last_state_id] = {
+            key: data[key]
+            for key in self.delta_fields if key in data
+        }
+        while len(self.sent_states) > self.n_kept_states:
+            self.sent_states.popitem(last=False)
+
+        return self.last_state_id
+
+    def _snapshot_content(self, data):
+        # full state. the client replaces its state with this
+        data['state_id'] = self._register_state(data)
+        data['base_id'] = None
+
+        return data
+
+    def _delta_content(self, data, Z_prev, base_id=None):
+        # only fields changed from the client's state (base_id) are included.
+        # if the state is unknown, the full state is sent
+        info = self.session.info
+        base = getattr(self, 'sent_states', {}).get(base_id)
+        content = {
+            'state_id': self._register_state(data),
+            'base_id': None if base is None else base_id
+        }
+        for key in data:
+            if base is None or key not in self.delta_fields or base.get(
+                    key) != data[key]:
+                content[key] = data[key]
+
+        emb = content.pop('emb')
+        if base is not None and info.quantize_emb_deltas and Z_prev.shape[
+                0] == emb['x'].shape[0]:
+            content['emb_delta'] = _quantize_delta(
+                np.column_stack((emb['x'], emb['y'])), Z_prev)
+        else:
+            content['emb'] = emb
+
+        return content
+
+    def _update_emb(self, content, seq=None, cancel_event=None, base_id=None):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
 
-    def _update_emb(self, content):
-        # read from records and take only x and y positions
-        Z_prev = np.array(
-            pd.DataFrame.from_records(content['data']['emb'])[['x', 'y']])
+        info = self.session.info
+        fit_cache = self.session.fit_cache
+
+        Z_prev = _prev_emb(content['data'])
         for key in content['data']['weights']:
             for w in content['data']['weights'][key]:
                 getattr(info, f'w_{key}')[w['label']] = w['val']
@@ -147,27 +451,26 @@ class WsHandler(WebSocket):
             if bound['label'] == 'alpha':
                 info.alpha = bound['val']
 
-        info.dr = info.dr.fit(info.X,
-                              y=info.y,
-                              w_tg=info.w_tg,
-                              w_bg=info.w_bg,
-                              w_bw=info.w_bw,
-                              Covs=info.Covs,
-                              alpha=info.alpha)
+        info.dr = fit_cache.fit(info.dr,
+                                info.X,
+                                y=info.y,
+                                w_tg=info.w_tg,
+                                w_bg=info.w_bg,
+                                w_bw=info.w_bw,
+                                Covs=info.Covs,
+                                alpha=info.alpha)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
         Z = info.dr.transform(info.X)
 
         if Z_prev.shape[0] > 0:
-            R = find_best_rotate(Z_prev, Z)
+            R = find_best_rotate(Z_prev, info._sample(Z))
             info.dr.update_projector(info.dr.M @ R)
             Z = info.dr.transform(info.X)
 
-        df_emb = pd.DataFrame({
-            'x': Z[:, 0],
-            'y': Z[:, 1],
-            'label': info.y,
-            'feat_vals': info.X.tolist()
-        })
-        emb = json.loads(df_emb.to_json(orient='records'))
+        # labels and feature values do not change and are not sent again
+        Z_shown = info._sample(Z)
+        emb = {'x': Z_shown[:, 0], 'y': Z_shown[:, 1]}
 
         n_feats, n_comps = info.dr.M.shape
         comps = {
@@ -186,15 +489,27 @@ class WsHandler(WebSocket):
             'emb': emb,
             'components': comps
         }
-
-        return json.dumps({'action': Message.updateEmb, 'content': data})
-
-    def _optimize_weights(self, content):
+        data.update(info._emb_summary(Z))
+
+        return _encode_message({
+            'action': Message.updateEmb,
+            'seq': seq,
+            'content': self._delta_content(data, Z_prev, base_id)
+        }, info.binary_transport)
+
+    def _optimize_weights(self,
+                          content,
+                          seq=None,
+                          cancel_event=None,
+                          base_id=None):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
+        info = self.session.info
+        fit_cache = self.session.fit_cache
         with_alpha = True
 
-        # read from records and take only x and y positions
-        Z_prev = np.array(
-            pd.DataFrame.from_records(content['data']['emb'])[['x', 'y']])
+        Z_prev = _prev_emb(content['data'])
 
         for key in content['data']['weights']:
             for w in content['data']['weights'][key]:
@@ -225,8 +540,8 @@ class WsHandler(WebSocket):
             updated_label=updated_label,
             ideal_areas=areas,
             ideal_dists=center_dists,
-            X=info.X,
-            y=info.y,
+            X=info._sample(info.X),
+            y=info._sample(info.y),
             with_alpha=with_alpha,
             alpha=info.alpha,
             Covs=info.Covs,
@@ -235,8 +550,15 @@ class WsHandler(WebSocket):
             Z_prev=Z_prev,
             apply_geom_trans=True,
             n_components=2,
-            method='COBYLA',
-            options={'maxiter': info.weight_opt_max_iter})
+            method=info.weight_opt_method,
+            options={'maxiter': info.weight_opt_max_iter},
+            fit_cache=fit_cache,
+            n_starts=info.weight_opt_n_starts,
+            time_budget=info.weight_opt_time_budget,
+            n_jobs=info.weight_opt_n_jobs,
+            cancel_event=cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            return None
 
         new_w_tg = {}
         new_w_bg = {}
@@ -253,27 +575,24 @@ class WsHandler(WebSocket):
         info.w_tg = new_w_tg
         info.w_bg = new_w_bg
         info.w_bw = new_w_bw
-        info.dr = info.dr.fit(info.X,
-                              y=info.y,
-                              w_tg=new_w_tg,
-                              w_bg=new_w_bg,
-                              w_bw=new_w_bw,
-                              Covs=info.Covs,
-                              alpha=info.alpha)
+        info.dr = fit_cache.fit(info.dr,
+                                info.X,
+                                y=info.y,
+                                w_tg=new_w_tg,
+                                w_bg=new_w_bg,
+                                w_bw=new_w_bw,
+                                Covs=info.Covs,
+                                alpha=info.alpha)
         Z = info.dr.transform(info.X)
 
         if Z_prev.shape[0] > 0:
-            R = find_best_rotate(Z_prev, Z)
+            R = find_best_rotate(Z_prev, info._sample(Z))
             info.dr.update_projector(info.dr.M @ R)
             Z = info.dr.transform(info.X)
 
-        df_emb = pd.DataFrame({
-            'x': Z[:, 0],
-            'y': Z[:, 1],
-            'label': info.y,
-            'feat_vals': info.X.tolist()
-        })
-        emb = json.loads(df_emb.to_json(orient='records'))
+        # labels and feature values do not change and are not sent again
+        Z_shown = info._sample(Z)
+        emb = {'x': Z_shown[:, 0], 'y': Z_shown[:, 1]}
 
         n_feats, n_comps = info.dr.M.shape
         comps = {
@@ -307,58 +626,143 @@ class WsHandler(WebSocket):
             'emb': emb,
             'components': comps
         }
+        data.update(info._emb_summary(Z))
 
-        return json.dumps({'action': Message.optimizeWeights, 'content': data})
+        return _encode_message({
+            'action': Message.optimizeWeights,
+            'seq': seq,
+            'content': self._delta_content(data, Z_prev, base_id)
+        }, info.binary_transport)
 
     def _save_result(self, content):
-        saved_info[content['name']] = copy.deepcopy(info)
+        self.session.save_result(content['name'])
 
-        return json.dumps({
-            'action': Message.saveResult,
-            'content': {
-                'dataNames': list(saved_info)
-            }
-        })
+        return _encode_message(
+            {
+                'action': Message.saveResult,
+                'content': {
+                    'dataNames': self.session.result_names()
+                }
+            }, self.session.info.binary_transport)
 
     def _load_result(self, content):
-        info = copy.deepcopy(saved_info[content['name']])
-        data = info._output_as_json()
-
-        return json.dumps({'action': Message.loadResult, 'content': data})
+        info = self.session.saved_result(content['name']).snapshot()
+        # the saved result can be the one of different data (snapshots of the
+        # same data share X)
+        if info.X is not self.session.info.X:
+            self.session.fit_cache.clear()
+        self.session.info = info
+        data = self._snapshot_content(info._output_as_json())
+
+        return _encode_message({
+            'action': Message.loadResult,
+            'content': data
+        }, info.binary_transport)
 
     def _initial_load(self):
-        data = info._output_as_json()
+        info = self.session.info
+        data = self._snapshot_content(info._output_as_json())
+        data['dataNames'] = self.session.result_names()
+
+        return _encode_message({
+            'action': Message.initialLoad,
+            'content': data
+        }, info.binary_transport)
 
-        return json.dumps({'action': Message.initialLoad, 'content': data})
+    def _resync(self):
+        # full state requested when the client cannot apply an update
+        info = self.session.info
+        data = self._snapshot_content(info._output_as_json())
+
+        return _encode_message({
+            'action': Message.resync,
+            'content': data
+        }, info.binary_transport)
 
     def _add_new_component(self, content):
-        info.new_comp[content['key']] = content['component']
+        self.session.info.new_comp[content['key']] = content['component']
+
+    def _feat_vals(self, content):
+        # values of one feature for all instances (requested when the feature
+        # is selected in UI)
+        info = self.session.info
+        feat_idx = int(content['feat_idx'])
+        data = {
+            'feat_idx': feat_idx,
+            'vals': np.asarray(info._sample(info.X[:, feat_idx]))
+        }
+
+        return _encode_message({
+            'action': Message.featVals,
+            'content': data
+        }, info.binary_transport)
+
+    def _run(self, func, *args):
+        # run on compute_worker and post the result back to the client. the
+        # message is queued and sent by WebSocket server's loop
+        try:
+            message = func(*args)
+            if message is not None:
+                self.send_message(message)
+        except Exception:
+            traceback.print_exc()
+
+    def _dispatch(self, func, *args):
+        # return to WebSocket server's loop immediately so that it can keep
+        # reading frames while func is running
+        return self.session.compute_worker.submit(self._run, func, *args)
 
     def handle(self):
-        m = json.loads(self.data)
+        # binary messages are sent by UI after receiving binary messages
+        m = json.loads(self.data) if isinstance(self.data,
+                                                str) else decode_binary(
+                                                    self.data)
         m_action = m['action']
 
         if m_action == Message.updateEmb:
-            self.send_message(self._update_emb(m['content']))
+            self._dispatch(self._update_emb, m['content'],
+                           *self.session.new_emb_request(m.get('seq')),
+                           m.get('base_id'))
         elif m_action == Message.optimizeWeights:
-            self.send_message(self._optimize_weights(m['content']))
+            self._dispatch(self._optimize_weights, m['content'],
+                           *self.session.new_emb_request(m.get('seq')),
+                           m.get('base_id'))
         elif m_action == Message.saveResult:
-            self.send_message(self._save_result(m['content']))
+            self._dispatch(self._save_result, m['content'])
         elif m_action == Message.loadResult:
-            self.send_message(self._load_result(m['content']))
+            self._dispatch(self._load_result, m['content'])
         elif m_action == Message.addNewComp:
-            self._add_new_component(m['content'])
+            self._dispatch(self._add_new_component, m['content'])
+        elif m_action == Message.featVals:
+            # only reads X and is answered without waiting for other actions
+            self.send_message(self._feat_vals(m['content']))
+        elif m_action == Message.resync:
+            self._dispatch(self._resync)
         else:
-            if info.verbose:
+            if self.session.info.verbose:
                 print('received action:', m_action)
 
     def connected(self):
-        if info.verbose:
-            print(self.address, 'connected')
-        self.send_message(self._initial_load())
-
-    def handleClose(self):
-        if info.verbose:
+        # session is selected with the session id in the URL (e.g.,
+        # ws://localhost:9000/?session=alice)
+        session_id = parse_qs(urlparse(self.request.path).query).get(
+            'session', [DEFAULT_SESSION_ID])[0]
+        self.session = get_session(session_id)
+        if self.session is None:
+            print(f'unknown session: {session_id}')
+            self.close(reason='unknown session')
+            return
+
+        self.session.clients.add(self)
+        if self.session.info.verbose:
+            print(self.address, 'connected to', session_id)
+        self._dispatch(self._initial_load)
+
+    def handle_close(self):
+        if getattr(self, 'session', None) is None:
+            return
+        self.session.clients.discard(self)
+        if self.session.info.verbose:
             print(self.address, 'closed')
 
 
@@ -412,12 +816,25 @@ class Plot(Singleton):
                      'scale': 0.2
                  },
                  weight_opt_max_iter=50,
+                 weight_opt_method='COBYLA',
+                 weight_opt_n_starts=1,
+                 weight_opt_time_budget=None,
+                 weight_opt_n_jobs=None,
+                 fit_cache_max_bytes=64 * 2**20,
+                 binary_transport=True,
+                 quantize_emb_deltas=False,
+                 max_points=None,
+                 density_grid_size=64,
+                 session_id=DEFAULT_SESSION_ID,
+                 store_dir=None,
                  inline_mode=True):
         """Plot ULCA result.
         Parameters
         ----------
         dr: ULCA instance.
-            ULCA instance after applying fit.
+            ULCA instance after applying fit. For ULCA (MANOPTULCA),
+            warm_start=True makes refits in UI start from the previous result,
+            which is faster and provides more stable layouts.
         X: array-like of shape(n_samples, n_features)
             X used when applying fit with ULCA.
         y: array-like of shape (n_samples,)
@@ -428,8 +845,9 @@ class Plot(Singleton):
             w_bg used when applying fit with ULCA.
         w_bw: array-like of shape (n_groups,) or dictionary
             w_bw used when applying fit with ULCA.
-        Covs: dictionary, optional, (default={})
-            Covs used when applying fit with ULCA.
+        Covs: GroupStats or dictionary, optional, (default={})
+            Covs used when applying fit with ULCA. If not provided, GroupStats
+            is computed from X and y and reused for all refits in UI.
         alpha: None or float, optional (default=None)
             alpha used when applying fit with ULCA.
         max_alpha: float, optional (default=10)
@@ -449,6 +867,58 @@ class Plot(Singleton):
             confidence ellipse is performed.
         weight_opt_max_iter: int, optional (default=50)
             # of maximum iterations when optimizing Eq. 12.
+        weight_opt_method: str, optional (default='COBYLA')
+            Optimization method for Eq. 12. 'COBYLA' (gradient-free) or
+            'L-BFGS-B' (gradient-based with analytic gradients; usually reaches
+            a lower cost with fewer refits).
+        weight_opt_n_starts: int, optional (default=1)
+            Number of starts when optimizing Eq. 12. Starts other than the
+            current weights use random weights and are run in parallel.
+        weight_opt_time_budget: None or float, optional (default=None)
+            Wall-clock time budget (in seconds) of optimizing Eq. 12 (e.g.,
+            0.5). When the budget is exhausted, the best weights found so far
+            are used. If None, the optimization runs until weight_opt_max_iter.
+        weight_opt_n_jobs: None or int, optional (default=None)
+            Maximum number of threads used by the starts of optimizing Eq. 12
+            in this session. If None, up to the number of CPUs. Useful to
+            share CPUs among sessions.
+        fit_cache_max_bytes: int, optional (default=64 * 2**20)
+            Memory budget of the cache of fitted projection matrices shared by
+            UI's refits and the weight optimization. Use 0 to disable caching.
+            Hit/miss counters are available via fit_cache_stats().
+        binary_transport: bool, optional (default=True)
+            If True, embedding positions are sent to UI as float32 binary
+            buffers with a small JSON header. If False, JSON messages are used.
+        quantize_emb_deltas: bool, optional (default=False)
+            Regardless of this parameter, updates of the embedding only include
+            fields changed from the UI's state. If True, positions are also
+            sent as differences from the shown positions quantized to int16
+            (half size of float32 and easier to compress, e.g., with
+            compression of an SSH tunnel).
+        max_points: None or int, optional (default=None)
+            If the number of instances exceeds max_points, the level-of-detail
+            mode is used: UI draws around max_points instances sampled from
+            each label in proportion to the label's size, together with density
+            grids of all instances. Confidence ellipses are still computed from
+            all instances. Useful for large data (e.g., more than 20,000
+            instances). If None, all instances are drawn.
+        density_grid_size: int, optional (default=64)
+            Number of bins along each axis of density grids in the
+            level-of-detail mode.
+        session_id: str, optional (default='default')
+            Id of the session showing this result. Each session has its own
+            data, model, saved results, and cache of fits while sharing the
+            HTTP and WebSocket servers, so that different results can be
+            explored at the same time (e.g., by different users of a shared
+            server). UI of a session is opened with
+            http://localhost:{http_port}/?session={session_id}.
+        store_dir: None or str, optional (default=None)
+            Directory of the on-disk store (ResultStore) of results saved in UI
+            and group statistics of data. If provided, results saved for the
+            same data (identified by the hash of X and y) in other sessions or
+            before restarting the kernel are listed in UI and loaded when
+            selected, and stored group statistics are used instead of
+            computing them.
         inline_mode: bool, optional (default=True)
             If True, showing UI with an inline mode (i.e., showing UI in
             the Jupyter Notebook's output cell using HTML IFrame).
@@ -525,23 +995,36 @@ class Plot(Singleton):
             self.ws_server_thread.daemon = True
             self.ws_server_thread.start()
 
+        # new dictionaries (not the default arguments) are made so that
+        # sessions do not share them
         if w_tg == {}:
-            for label in np.unique(y):
-                w_tg[label] = 0
+            w_tg = {label: 0 for label in np.unique(y)}
         if w_bg == {}:
-            for label in np.unique(y):
-                w_bg[label] = 1
+            w_bg = {label: 1 for label in np.unique(y)}
         if w_bw == {}:
-            for label in np.unique(y):
-                w_bw[label] = 1
+            w_bw = {label: 1 for label in np.unique(y)}
         if feat_names is None:
             feat_names = list(range(X.shape[1]))
         if y_to_name == {}:
-            for label in np.unique(y):
-                y_to_name[label] = f'Label {label}'
+            y_to_name = {label: f'Label {label}' for label in np.unique(y)}
         if alpha is None:
             alpha = 1 / dr.get_final_cost()
-
+        store = ResultStore(store_dir) if store_dir is not None else None
+        dataset_key = store.dataset_key(X, y) if store is not None else None
+        if not isinstance(Covs, GroupStats) and len(Covs.keys()) == 0:
+            # compute group statistics once and reuse them for all refits
+            # (and, with store_dir, for the same data in the other sessions)
+            Covs = store.load_group_stats(
+                dataset_key) if store is not None else None
+            if Covs is None:
+                Covs = GroupStats.from_data(X, y)
+                if store is not None:
+                    store.save_group_stats(dataset_key, Covs)
+
+        session = get_session(session_id, create=True)
+        session.store = store
+        session.dataset_key = dataset_key
+        info = session.info
         info.dr = dr
         info.X = X
         info.y = y
@@ -556,19 +1039,39 @@ class Plot(Singleton):
         info.feat_names = feat_names
         info.y_to_name = y_to_name
         info.weight_opt_max_iter = weight_opt_max_iter
-
-        if len(saved_info) == 0:
-            saved_info['-'] = copy.deepcopy(info)
+        info.weight_opt_method = weight_opt_method
+        info.weight_opt_n_starts = weight_opt_n_starts
+        info.weight_opt_time_budget = weight_opt_time_budget
+        info.weight_opt_n_jobs = weight_opt_n_jobs
+        info.binary_transport = binary_transport
+        info.quantize_emb_deltas = quantize_emb_deltas
+        info.sample_indices = _stratified_sample(
+            y, max_points) if max_points is not None and len(
+                y) > max_points else None
+        info.density_grid_size = density_grid_size
+
+        # cached fits are only valid for the same data and model
+        session.fit_cache.clear()
+        session.fit_cache.max_bytes = fit_cache_max_bytes
+
+        if len(session.saved_info) == 0:
+            session.saved_info['-'] = info.snapshot()
 
         # load local webpage
         url = f'http://localhost:{self.http_port}/'
+        if session_id != DEFAULT_SESSION_ID:
+            url += f'?session={quote(session_id)}'
         view = IFrame(src=url, width='100%',
                       height='500px') if inline_mode else webbrowser.open(url)
 
         return view
 
-    def current_info(self):
+    def current_info(self, session_id=DEFAULT_SESSION_ID):
         """Accessing information the current ULCA result shown in UI.
+        Parameters
+        ----------
+        session_id: str, optional (default='default')
+            Session id used for plot_emb().
 
         Returns
         -------
@@ -586,20 +1089,73 @@ class Plot(Singleton):
             w_dist,
             feat_names,
             y_to_name,
-            weight_opt_max_iter
+            weight_opt_max_iter,
+            weight_opt_method,
+            weight_opt_n_starts,
+            weight_opt_time_budget,
+            weight_opt_n_jobs,
+            binary_transport,
+            quantize_emb_deltas,
+            sample_indices (instances shown in the level-of-detail mode),
+            density_grid_size
         These attributes correspond to parameters used for plot_emb().
         Attributes related to ULCA optimization (w_tg, w_bg, w_bw, alpha) are
         updated during the intearctive analysis using UI.
         """
-        return info
+        return get_session(session_id).info
 
-    def saved_info(self):
+    def saved_info(self, session_id=DEFAULT_SESSION_ID):
         """Accessing all saved info via saving function in UI.
+        Parameters
+        ----------
+        session_id: str, optional (default='default')
+            Session id used for plot_emb().
         Returns
         -------
         Dictionary of Info class instances where key is a name used when saving
         and item is the corresponding Info class instances.
         '-' is a specical key used to indicate the current Info.
+        Results only in the store (refer to store_dir of plot_emb()) are
+        included after they are loaded in UI.
+        """
+
+        return get_session(session_id).saved_info
+
+    def fit_cache_stats(self, session_id=DEFAULT_SESSION_ID):
+        """Accessing hit/miss counters and memory usage of the cache of
+        fitted projection matrices.
+        Parameters
+        ----------
+        session_id: str, optional (default='default')
+            Session id used for plot_emb().
+        Returns
+        -------
+        Dictionary with 'hits', 'misses', 'n_entries', 'n_bytes', and
+        'max_bytes' keys.
+        """
+
+        return get_session(session_id).fit_cache.stats()
+
+    def session_ids(self):
+        """Ids of the sessions created with plot_emb().
+        Returns
+        -------
+        List of session ids.
+        """
+
+        with sessions_lock:
+            return list(sessions)
+
+    def close_session(self, session_id):
+        """Close the session (disconnect its UI and release its data, model,
+        saved results, and cache of fits).
+        Parameters
+        ----------
+        session_id: str
+            Session id used for plot_emb().
         """
 
-        return saved_info
+        with sessions_lock:
+            session = sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
@@ -13,6 +13,10 @@ import {
   initSvgInfo
 } from './d3_utils.js';
 
+import {
+  sendMessage
+} from './transport.js';
+
 import {
   svgDataTemplate
 } from './model.js';
@@ -65,6 +69,54 @@ const compBasicStats = (data, uniqLabels) => {
   return stats;
 };
 
+const basicStatsFromServer = (embStats) => {
+  // statistics of all points computed by the server (level-of-detail mode)
+  const stats = {};
+  for (const stat of embStats) {
+    stats[stat.label] = Object.assign({}, stat, {
+      'sdX': Math.sqrt(Math.max(0, stat.varX)),
+      'sdY': Math.sqrt(Math.max(0, stat.varY))
+    });
+  }
+  return stats;
+};
+
+const drawDensity = (densityArea, density, x, y, maxOpacity = 0.6) => {
+  // draw binned counts of each label's points as colored cells
+  const size = density.size;
+  const cellW = (density.x_range[1] - density.x_range[0]) / size;
+  const cellH = (density.y_range[1] - density.y_range[0]) / size;
+  const maxCount = density.counts.reduce((acc, c) => acc > c ? acc : c, 0);
+
+  const cells = [];
+  density.labels.forEach((label, k) => {
+    for (let row = 0; row < size; row++) {
+      for (let col = 0; col < size; col++) {
+        const count = density.counts[(k * size + row) * size + col];
+        if (count > 0) {
+          cells.push({
+            'label': label,
+            'x0': density.x_range[0] + col * cellW,
+            'y1': density.y_range[0] + (row + 1) * cellH,
+            'opacity': maxOpacity * Math.log1p(count) / Math.log1p(maxCount)
+          });
+        }
+      }
+    }
+  });
+
+  densityArea.selectAll('rect')
+    .data(cells)
+    .join('rect')
+    .attr('x', d => x(d.x0))
+    .attr('y', d => y(d.y1))
+    .attr('width', x(cellW) - x(0))
+    .attr('height', y(0) - y(cellH))
+    .attr('fill', d => percentColToD3Rgb(pallette[d.label]))
+    .attr('fill-opacity', d => d.opacity)
+    .attr('pointer-events', 'none');
+};
+
 const compConfAreaInfo = (stat, confIntPer = 50) => {
   // Ref: https://www.xarg.org/2018/04/how-to-plot-a-covariance-error-ellipse/
 
@@ -318,13 +370,13 @@ const genDrawNewComp = (compDrawAreaSvg, computeNewComponent, allSvgData, wsInfo
   return drawNewComp;
 }
 
-const genFeatValToSize = (data, featIdx = -1, minSize = 2, maxSize = 6) => {
+const genFeatValToSize = (featVals = null, minSize = 2, maxSize = 6) => {
   let featValToSize = (val) => (minSize + maxSize) * 0.5;
-  if (featIdx >= 0) {
-    const maxVal = data.reduce((acc, d) =>
-      acc > d.feat_vals[featIdx] ? acc : d.feat_vals[featIdx], -Number.MAX_VALUE);
-    const minVal = data.reduce((acc, d) =>
-      acc < d.feat_vals[featIdx] ? acc : d.feat_vals[featIdx], Number.MAX_VALUE);
+  if (featVals) {
+    const maxVal = featVals.reduce((acc, val) =>
+      acc > val ? acc : val, -Number.MAX_VALUE);
+    const minVal = featVals.reduce((acc, val) =>
+      acc < val ? acc : val, Number.MAX_VALUE);
     if (maxVal - minVal > 0) {
       featValToSize = (val) =>
         minSize + (maxSize - minSize) * (val - minVal) / (maxVal - minVal);
@@ -336,6 +388,7 @@ const genFeatValToSize = (data, featIdx = -1, minSize = 2, maxSize = 6) => {
 export const genChart = () => {
   let svg = null;
   let compDrawAreaSvg = null;
+  let densityArea = null;
   let dot = null;
   let confAreaVis = null;
   let confAreaOut = null;
@@ -351,6 +404,7 @@ export const genChart = () => {
       svg = svgData.svg.attr('viewBox',
         [0, 0, svgData.svgArea.width, svgData.svgArea.height]);
       compDrawAreaSvg = svg.append('g');
+      densityArea = svg.append('g');
       confAreaVis = svg.append('g');
       confAreaOut = svg.append('g');
       confAreaMiddle = svg.append('g');
@@ -364,10 +418,17 @@ export const genChart = () => {
 
     const data = svgData.data;
 
-    const xMin = data.reduce((acc, d) => acc < d.x ? acc : d.x, Number.MAX_VALUE);
-    const xMax = data.reduce((acc, d) => acc > d.x ? acc : d.x, -Number.MAX_VALUE);
-    const yMin = data.reduce((acc, d) => acc < d.y ? acc : d.y, Number.MAX_VALUE);
-    const yMax = data.reduce((acc, d) => acc > d.y ? acc : d.y, -Number.MAX_VALUE);
+    // in the level-of-detail mode, data only contains sampled points and
+    // the density of all points is used for the domain
+    const density = svgData.density;
+    const xMin = density ? density.x_range[0] :
+      data.reduce((acc, d) => acc < d.x ? acc : d.x, Number.MAX_VALUE);
+    const xMax = density ? density.x_range[1] :
+      data.reduce((acc, d) => acc > d.x ? acc : d.x, -Number.MAX_VALUE);
+    const yMin = density ? density.y_range[0] :
+      data.reduce((acc, d) => acc < d.y ? acc : d.y, Number.MAX_VALUE);
+    const yMax = density ? density.y_range[1] :
+      data.reduce((acc, d) => acc > d.y ? acc : d.y, -Number.MAX_VALUE);
     const range = Math.max(xMax - xMin, yMax - yMin);
     const xDomain = [(xMax + xMin - range) / 2, (xMax + xMin + range) / 2];
     const yDomain = [(yMax + yMin - range) / 2, (yMax + yMin + range) / 2];
@@ -396,7 +457,14 @@ export const genChart = () => {
       compDrawAreaSvg, computeNewComponent, allSvgData, wsInfo);
     compDrawAreaSvg.call(drawNewComp);
 
-    const featValToSize = genFeatValToSize(data, featIdx);
+    // feature values are available only after fetched from server
+    const featVals = featIdx >= 0 ? allSvgData.featVals.data[featIdx] : null;
+    const featValToSize = genFeatValToSize(featVals);
+
+    densityArea.selectAll('*').remove();
+    if (density) {
+      drawDensity(densityArea, density, x, y);
+    }
 
     // draw scatterplot
     dot.selectAll('circle')
@@ -404,7 +472,7 @@ export const genChart = () => {
       .join(
         enter => enter.append('circle')
         .attr('dot-id', (d, i) => i)
-        .attr('r', (d) => featValToSize(featIdx >= 0 ? d.feat_vals[featIdx] : 0))
+        .attr('r', (d, i) => featValToSize(featVals ? featVals[i] : 0))
         .attr('stroke', '#444444')
         .attr('stroke-width', 0.5)
         .attr('stroke-opacity', 1.0)
@@ -437,9 +505,10 @@ export const genChart = () => {
       );
 
     // prepare confidence interval info
-    const uniqLabels = [...data.reduce((acc, d) => acc.add(d.label), new Set())];
+    const uniqLabels = svgData.stats ? svgData.stats.map(stat => stat.label) : [...data.reduce((acc, d) => acc.add(d.label), new Set())];
 
-    const stats = compBasicStats(data, uniqLabels);
+    const stats = svgData.stats ? basicStatsFromServer(svgData.stats) :
+      compBasicStats(data, uniqLabels);
     const infoConfAreas = uniqLabels.map(l => compConfAreaInfo(stats[l]));
 
     if (!infoEllipses) {
@@ -660,10 +729,13 @@ export const genChart = () => {
       }
 
       if (wsInfo !== null) {
-        wsInfo.ws.send(JSON.stringify({
+        wsInfo.seq += 1;
+        sendMessage(wsInfo, {
           action: wsInfo.messageActions.optimizeWeights,
+          seq: wsInfo.seq,
+          base_id: wsInfo.stateId,
           content: content
-        }));
+        });
       }
     };
 
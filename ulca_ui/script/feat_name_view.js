@@ -68,11 +68,26 @@ export const genChart = () => {
       .attr('feat-id', (d, i) => i)
       .on('mouseover',
         function(event, d) {
-          const i = d3.select(this).attr('feat-id');
-          // TODO: move this in a separate file
-          embChart(allSvgData, wsInfo, true, i);
+          const i = Number(d3.select(this).attr('feat-id'));
+          allSvgData.featVals.hoveredIdx = i;
+          if (allSvgData.featVals.data[i] === undefined) {
+            // feature values are fetched once and embChart is updated when
+            // they arrive
+            if (wsInfo !== null) {
+              wsInfo.ws.send(JSON.stringify({
+                action: wsInfo.messageActions.featVals,
+                content: {
+                  'feat_idx': i
+                }
+              }));
+            }
+          } else {
+            // TODO: move this in a separate file
+            embChart(allSvgData, wsInfo, true, i);
+          }
         })
       .on("mouseout", () => {
+        allSvgData.featVals.hoveredIdx = -1;
         embChart(allSvgData, wsInfo, true, -1);
       });
 
@@ -4,8 +4,10 @@ import * as wv from './weight_view.js';
 import * as ev from './emb_view.js';
 import * as cv from './component_view.js';
 import * as fnv from './feat_name_view.js';
+import * as tr from './transport.js';
 
 m.wsInfo.ws = new WebSocket(m.wsUrl);
+m.wsInfo.ws.binaryType = 'arraybuffer';
 const tgWeightChart = wv.genChart('tgWeight');
 const bgWeightChart = wv.genChart('bgWeight');
 const bwWeightChart = wv.genChart('bwWeight');
@@ -15,6 +17,22 @@ const compXChart = cv.genChart('compX');
 const compYChart = cv.genChart('compY');
 const compFeatNameChart = fnv.genChart();
 
+const updateDataNames = (dataNames) => {
+  const dataNameSelect = document.querySelector('#data_names');
+  dataNameSelect.options.length = 0;
+
+  for (const name of dataNames) {
+    const option = document.createElement('option');
+    option.text = name;
+    option.value = name;
+    dataNameSelect.add(option, 0)
+    dataNameSelect.selectedIndex = 0;
+  }
+};
+
+// labels of instances (only sent with initialLoad and loadResult)
+let embLabels = [];
+
 const init = (content) => {
   util.initSvgInfo({
     'svgData': m.allSvgData.tgWeight,
@@ -115,6 +133,11 @@ const init = (content) => {
 
   m.allSvgData.emb.contentType = 'emb';
   m.allSvgData.emb.data = content.emb;
+  // statistics and density of all points (only in the level-of-detail mode)
+  m.allSvgData.emb.stats = content.emb_stats || null;
+  m.allSvgData.emb.density = content.density || null;
+  embLabels = content.emb.map(d => d.label);
+  m.allSvgData.featVals.data = [];
 
   m.allSvgData.compX.subtitle = 'x';
   m.allSvgData.compX.contentType = 'compX';
@@ -139,17 +162,51 @@ const init = (content) => {
 }
 
 m.wsInfo.ws.onmessage = wsEvent => {
-  const data = JSON.parse(wsEvent.data);
+  let data = null;
+  if (wsEvent.data instanceof ArrayBuffer) {
+    data = tr.decodeBinary(wsEvent.data);
+    m.wsInfo.binary = true;
+  } else {
+    data = JSON.parse(wsEvent.data);
+  }
   const content = data.content;
+  if (content.emb) {
+    content.emb = tr.embToRecords(content.emb);
+  }
   const action = data.action;
-  m.allSvgData.tgWeight.data.length = 0;
-  m.allSvgData.bgWeight.data.length = 0;
-  m.allSvgData.bwWeight.data.length = 0;
-  m.allSvgData.ratioBoundary.data.length = 0;
-  m.allSvgData.emb.data.length = 0;
+  if ((action === m.wsInfo.messageActions.updateEmb ||
+      action === m.wsInfo.messageActions.optimizeWeights) &&
+    data.seq !== undefined && data.seq < m.wsInfo.seq) {
+    // ignore a stale result superseded by a newer request
+    return;
+  }
+  if (action === m.wsInfo.messageActions.featVals) {
+    m.allSvgData.featVals.data[content.feat_idx] = content.vals;
+    if (m.allSvgData.featVals.hoveredIdx === content.feat_idx) {
+      embChart(m.allSvgData, m.wsInfo, true, content.feat_idx);
+    }
+    return;
+  }
+  if ((action === m.wsInfo.messageActions.updateEmb ||
+      action === m.wsInfo.messageActions.optimizeWeights) &&
+    content.base_id !== null && content.base_id !== m.wsInfo.stateId) {
+    // the update is not based on the current state. request the full state
+    m.wsInfo.ws.send(JSON.stringify({
+      action: m.wsInfo.messageActions.resync,
+      content: {}
+    }));
+    return;
+  }
+  if (content.state_id !== undefined) {
+    m.wsInfo.stateId = content.state_id;
+  }
 
   if (action === m.wsInfo.messageActions.initialLoad) {
     init(content);
+    // including results stored on disk by the server
+    if (content.dataNames) {
+      updateDataNames(content.dataNames);
+    }
     document.querySelector('#data_names').addEventListener('change', () => {
       const dataName = document.querySelector('#data_names').value;
       const content = {};
@@ -180,37 +237,59 @@ m.wsInfo.ws.onmessage = wsEvent => {
       document.querySelector('#save_button').innerHTML = 'Save'
     }, 1000);
 
-    const dataNameSelect = document.querySelector('#data_names');
-    dataNameSelect.options.length = 0;
-
-    for (const name of content.dataNames) {
-      const option = document.createElement('option');
-      option.text = name;
-      option.value = name;
-      dataNameSelect.add(option, 0)
-      dataNameSelect.selectedIndex = 0;
-    }
-  } else if (action === m.wsInfo.messageActions.loadResult) {
+    updateDataNames(content.dataNames);
+  } else if (action === m.wsInfo.messageActions.loadResult ||
+    action === m.wsInfo.messageActions.resync) {
     init(content);
   } else {
-    for (const d of content.weights.tg) {
-      m.allSvgData.tgWeight.data.push(d);
+    // updates only contain fields changed from the current state
+    if (content.weights) {
+      for (const [wType, key] of [
+          ['tg', 'tgWeight'],
+          ['bg', 'bgWeight'],
+          ['bw', 'bwWeight']
+        ]) {
+        m.allSvgData[key].data.length = 0;
+        for (const d of content.weights[wType]) {
+          m.allSvgData[key].data.push(d);
+        }
+      }
+    }
+    if (content.bounds) {
+      m.allSvgData.ratioBoundary.data.length = 0;
+      for (const d of content.bounds) {
+        m.allSvgData.ratioBoundary.data.push(d);
+      }
+    }
+    if (content.emb) {
+      // positions only (labels are kept from the full state)
+      m.allSvgData.emb.data.length = 0;
+      content.emb.forEach((d, i) => {
+        m.allSvgData.emb.data.push({
+          'x': d.x,
+          'y': d.y,
+          'label': embLabels[i]
+        });
+      });
+    } else if (content.emb_delta) {
+      // quantized differences from the current positions
+      const delta = content.emb_delta;
+      m.allSvgData.emb.data.forEach((d, i) => {
+        d.x += delta.x[i] * delta.step;
+        d.y += delta.y[i] * delta.step;
+      });
     }
-    for (const d of content.weights.bg) {
-      m.allSvgData.bgWeight.data.push(d);
+    if (content.emb_stats) {
+      m.allSvgData.emb.stats = content.emb_stats;
     }
-    for (const d of content.weights.bw) {
-      m.allSvgData.bwWeight.data.push(d);
+    if (content.density) {
+      m.allSvgData.emb.density = content.density;
     }
-    for (const d of content.bounds) {
-      m.allSvgData.ratioBoundary.data.push(d);
+    if (content.components) {
+      m.allSvgData.compX.data = content.components.x;
+      m.allSvgData.compY.data = content.components.y;
+      m.allSvgData.compFeatName.data = content.components.feat_names;
     }
-    for (const d of content.emb) {
-      m.allSvgData.emb.data.push(d);
-    };
-    m.allSvgData.compX.data = content.components.x;
-    m.allSvgData.compY.data = content.components.y;
-    m.allSvgData.compFeatName.data = content.components.feat_names;
     tgWeightChart(m.allSvgData, m.wsInfo, false);
     bgWeightChart(m.allSvgData, m.wsInfo, false);
     bwWeightChart(m.allSvgData, m.wsInfo, false);
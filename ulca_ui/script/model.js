@@ -19,20 +19,37 @@ export const allSvgData = {
   compX: svgDataTemplate(),
   compY: svgDataTemplate(),
   compFeatName: svgDataTemplate(),
-  labelToName: svgDataTemplate() // TODO: this doesn't need to contain svg
+  labelToName: svgDataTemplate(), // TODO: this doesn't need to contain svg
+  // values of each feature fetched from server only when needed
+  // (data[featIdx]: values of all instances)
+  featVals: {
+    data: [],
+    hoveredIdx: -1
+  }
 };
 
 // change websocket URL based on your env
-export const wsUrl = `ws://localhost:9000`;
+// session of the server shown in this page (e.g., ?session=alice)
+export const sessionId = new URLSearchParams(window.location.search).get('session') || 'default';
+export const wsUrl = `ws://localhost:9000/?session=${encodeURIComponent(sessionId)}`;
 export const wsInfo = {
   ws: undefined,
   dataKey: undefined,
+  // sequence number of the latest request updating the embedding
+  seq: 0,
+  // true after receiving binary messages from the server
+  binary: false,
+  // id of the state (weights, embedding, etc.) received from the server.
+  // updates from the server only contain changes from this state
+  stateId: null,
   messageActions: {
     updateEmb: 0,
     optimizeWeights: 1,
     saveResult: 2,
     loadResult: 3,
     initialLoad: 4,
-    addNewComp: 5
+    addNewComp: 5,
+    featVals: 6,
+    resync: 7
   }
 };
\ No newline at end of file
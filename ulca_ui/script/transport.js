@@ -0,0 +1,132 @@
+// Binary message format shared with the server (ulca_ui/utils/transport.py):
+//   uint32 (little-endian): byte length of the header
+//   header: UTF-8 JSON of the message where arrays are removed
+//   zero padding to align the following buffers to 4 bytes
+//   buffers: little-endian float32/int32/int16 arrays in the order of
+//            header.buffers ([key path, dtype, length] of each array), each
+//            padded to 4 bytes
+const typedArrays = {
+  'float32': Float32Array,
+  'int32': Int32Array,
+  'int16': Int16Array
+};
+
+const padTo4 = nBytes => nBytes + (4 - nBytes % 4) % 4;
+
+const dtypeOf = arr => {
+  for (const dtype of Object.keys(typedArrays)) {
+    if (arr instanceof typedArrays[dtype]) {
+      return dtype;
+    }
+  }
+  return null;
+};
+
+const splitArrays = (obj, path, arrays) => {
+  if (ArrayBuffer.isView(obj) && dtypeOf(obj) !== null) {
+    arrays.push([path, obj]);
+    return null;
+  }
+  if (obj !== null && typeof obj === 'object' && !Array.isArray(obj)) {
+    const result = {};
+    for (const key of Object.keys(obj)) {
+      result[key] = splitArrays(obj[key], path.concat([key]), arrays);
+    }
+    return result;
+  }
+  return obj;
+};
+
+export const encodeBinary = (message) => {
+  const arrays = [];
+  const header = splitArrays(message, [], arrays);
+  header.buffers = arrays.map(([path, arr]) => [path, dtypeOf(arr), arr.length]);
+
+  let headerBytes = new TextEncoder().encode(JSON.stringify(header));
+  const padding = (4 - (4 + headerBytes.length) % 4) % 4;
+  const paddedHeaderBytes = new Uint8Array(headerBytes.length + padding);
+  paddedHeaderBytes.fill(32); // space
+  paddedHeaderBytes.set(headerBytes);
+  headerBytes = paddedHeaderBytes;
+
+  const nBytes = 4 + headerBytes.length +
+    arrays.reduce((acc, [path, arr]) => acc + padTo4(arr.byteLength), 0);
+  const buffer = new ArrayBuffer(nBytes);
+  new DataView(buffer).setUint32(0, headerBytes.length, true);
+  new Uint8Array(buffer, 4, headerBytes.length).set(headerBytes);
+  let offset = 4 + headerBytes.length;
+  for (const [path, arr] of arrays) {
+    new Uint8Array(buffer, offset, arr.byteLength).set(
+      new Uint8Array(arr.buffer, arr.byteOffset, arr.byteLength));
+    offset += padTo4(arr.byteLength);
+  }
+
+  return buffer;
+};
+
+export const decodeBinary = (buffer) => {
+  const headerLen = new DataView(buffer).getUint32(0, true);
+  const message = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, 4, headerLen)));
+  let offset = 4 + headerLen;
+  for (const [path, dtype, length] of message.buffers) {
+    // views of the received buffer (no copy)
+    const arr = new typedArrays[dtype](buffer, offset, length);
+    offset += padTo4(arr.byteLength);
+
+    let target = message;
+    for (const key of path.slice(0, -1)) {
+      if (target[key] === undefined || target[key] === null) {
+        target[key] = {};
+      }
+      target = target[key];
+    }
+    target[path[path.length - 1]] = arr;
+  }
+  delete message.buffers;
+
+  return message;
+};
+
+// embedding in binary messages ({x, y, label} of arrays) to records of points
+export const embToRecords = (emb) => {
+  if (Array.isArray(emb)) {
+    return emb;
+  }
+  const records = new Array(emb.x.length);
+  for (let i = 0; i < records.length; i++) {
+    records[i] = {
+      'x': emb.x[i],
+      'y': emb.y[i]
+    };
+    if (emb.label) {
+      records[i].label = emb.label[i];
+    }
+  }
+  return records;
+};
+
+// records of points to arrays sent in binary messages
+export const embFromRecords = (records) => {
+  const emb = {
+    'x': new Float32Array(records.length),
+    'y': new Float32Array(records.length)
+  };
+  records.forEach((d, i) => {
+    emb.x[i] = d.x;
+    emb.y[i] = d.y;
+  });
+  return emb;
+};
+
+// send message in the same format as the one received from the server
+export const sendMessage = (wsInfo, message) => {
+  if (wsInfo.binary) {
+    if (message.content && message.content.data && message.content.data.emb) {
+      message.content.data.emb = embFromRecords(message.content.data.emb);
+    }
+    wsInfo.ws.send(encodeBinary(message));
+  } else {
+    wsInfo.ws.send(JSON.stringify(message));
+  }
+};
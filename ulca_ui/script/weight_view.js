@@ -10,6 +10,10 @@ import {
   setCategoryLegend
 } from './d3_utils.js';
 
+import {
+  sendMessage
+} from './transport.js';
+
 export const genChart = (weightType, xDomainMaxLimit = 1) => {
   let svg = null;
   let bar = null;
@@ -239,10 +243,13 @@ export const genChart = (weightType, xDomainMaxLimit = 1) => {
       }
 
       if (wsInfo !== null) {
-        wsInfo.ws.send(JSON.stringify({
+        wsInfo.seq += 1;
+        sendMessage(wsInfo, {
           action: wsInfo.messageActions.updateEmb,
+          seq: wsInfo.seq,
+          base_id: wsInfo.stateId,
           content: content
-        }));
+        });
       }
     };
 
@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FitCache():
+    """LRU cache of fitted projection matrices keyed by quantized weights,
+    alpha, gamma0, and gamma1. Shared by the UI's refits and the weight
+    optimization (optimize_cost), which often revisit identical or
+    near-identical weights (e.g., the final refit after the optimization
+    repeats the best evaluated point).
+    Parameters
+    ----------
+    max_bytes: int, optional (default=64 * 2**20)
+        Memory budget of cached projection matrices. The least recently used
+        entries are evicted when the budget is exceeded.
+    resolution: float, optional (default=1e-6)
+        Quantization step of weights, alpha, gamma0, and gamma1. Values
+        falling into the same step share one cache entry.
+    Attributes
+    ----------
+    hits: int
+        Number of fits answered from the cache.
+    misses: int
+        Number of fits actually performed.
+    n_bytes: int
+        Current memory used by cached projection matrices (and means).
+    Notes
+    -----
+    A cache hit restores M, M_opt (if exists), alpha, mean, and the final
+    cost of the fit. The manopt problem of manifold ULCA is not cached and is
+    set to None, so get_final_cost returns the cached cost.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, resolution=1e-6):
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self.hits = 0
+        self.misses = 0
+        self.n_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _quantize(self, vals):
+        if vals is None:
+            return None
+        if isinstance(vals, dict):
+            vals = [vals[key] for key in sorted(vals)]
+        return tuple(
+            np.round(np.atleast_1d(np.asarray(vals, dtype=float)) /
+                     self.resolution).astype(np.int64).tolist())
+
+    def key(self, dr, w_tg, w_bg, w_bw, alpha=None, gamma0=None, gamma1=None):
+        """Cache key of a fit. The DR class and the number of components are
+        included so that one cache can be used with different models. Classes
+        generated by gen_ldr (all named LDR) are identified by the arguments
+        of gen_ldr.
+        """
+        cls = type(dr)
+        return (getattr(cls, '_gen_args', cls), getattr(dr, 'n_components',
+                                                        None),
+                self._quantize(w_tg), self._quantize(w_bg),
+                self._quantize(w_bw), self._quantize(alpha),
+                self._quantize(gamma0), self._quantize(gamma1))
+
+    def get(self, key):
+        """Return (M, alpha, mean, final_cost) stored with key or None
+        (counted as a miss).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    @staticmethod
+    def _entry_nbytes(entry):
+        M, _, mean, _ = entry
+        return M.nbytes + (0 if mean is None else mean.nbytes)
+
+    def put(self, key, M, alpha=None, mean=None, final_cost=None):
+        with self._lock:
+            if key in self._entries:
+                self.n_bytes -= self._entry_nbytes(self._entries.pop(key))
+            entry = (np.array(M), alpha,
+                     None if mean is None else np.array(mean), final_cost)
+            nbytes = self._entry_nbytes(entry)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.n_bytes += nbytes
+            while self.n_bytes > self.max_bytes:
+                _, old_entry = self._entries.popitem(last=False)
+                self.n_bytes -= self._entry_nbytes(old_entry)
+
+    def clear(self):
+        """Remove all entries and reset the counters (e.g., when data is
+        changed).
+        """
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def fit(self,
+            dr,
+            X,
+            y,
+            w_tg,
+            w_bg,
+            w_bw,
+            Covs={},
+            alpha=None,
+            gamma0=None,
+            gamma1=None):
+        """Same with dr.fit but reuses a cached projection matrix when the
+        same (quantized) parameters were fitted before.
+        Returns
+        -------
+        dr.
+        """
+        key = self.key(dr, w_tg, w_bg, w_bw, alpha, gamma0, gamma1)
+        entry = self.get(key)
+        if entry is not None:
+            M, fitted_alpha, mean, final_cost = entry
+            M = M.copy()
+            dr.update_projector(M)
+            if hasattr(dr, 'M_opt'):
+                # manifold ULCA. the problem belongs to the previous fit
+                dr.M_opt = M
+                dr.problem = None
+                dr.final_cost = final_cost
+            if hasattr(dr, 'alpha'):
+                dr.alpha = fitted_alpha
+            dr.mean = None if mean is None else mean.copy()
+            return dr
+
+        dr.fit(X,
+               y=y,
+               w_tg=w_tg,
+               w_bg=w_bg,
+               w_bw=w_bw,
+               Covs=Covs,
+               alpha=alpha,
+               gamma0=gamma0,
+               gamma1=gamma1)
+        self.put(key,
+                 dr.M,
+                 alpha=getattr(dr, 'alpha', None),
+                 mean=getattr(dr, 'mean', None),
+                 final_cost=dr.get_final_cost())
+
+        return dr
+
+    def stats(self):
+        """Hit/miss counters and memory usage as a dictionary."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'n_entries': len(self),
+            'n_bytes': self.n_bytes,
+            'max_bytes': self.max_bytes
+        }
@@ -2,6 +2,12 @@ from scipy.linalg import svd
 
 
 def find_best_rotate(Z_prev, Z):
-    U, s, Vh = svd(Z_prev.T @ Z)
+    return find_best_rotate_from_cross(Z_prev.T @ Z)
+
+
+def find_best_rotate_from_cross(Z_prev_T_Z):
+    # same with find_best_rotate but takes Z_prev.T @ Z, which can be computed
+    # without Z (e.g., (Z_prev.T @ X) @ M)
+    U, s, Vh = svd(Z_prev_T_Z)
     R = Vh.T @ U.T
     return R
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from manopt_dr.group_stats import GroupStats, DEFAULT_BLOCK_ELEMENTS
+
+
+class ResultStore():
+    """On-disk store of results saved in UI (weights, alpha, and projection
+    matrices) and group statistics of datasets. Datasets are identified with
+    hashes of their contents, so that results and statistics stored in one
+    session can be used in other sessions (or after restarting the kernel)
+    with the same data.
+    Files in the directory:
+        results/<dataset key>/*.npz: each stored result
+        results/<dataset key>/*.json: name and saving time of each result
+        stats/<dataset key>.npz: group statistics of each dataset
+    Each file is written by only one save and replaced at once, so that
+    stores in different sessions and processes (e.g., kernels) can use the
+    same directory without locks. Only .json files of the dataset are read
+    until a result or statistics are requested.
+    Parameters
+    ----------
+    path: str or Path
+        Directory of the store (created if not exists).
+
+    Examples
+    --------
+    >>> from ulca_ui.utils.result_store import ResultStore
+
+    >>> store = ResultStore('./ulca_results')
+    >>> key = store.dataset_key(X, y)
+    >>> store.save_result(key, 'view 1', ulca.M, alpha, w_tg, w_bg, w_bw)
+    >>> store.result_names(key)
+    ['view 1']
+    >>> result = store.load_result(key, 'view 1')  # dictionary with 'M', etc.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        (self.path / 'results').mkdir(parents=True, exist_ok=True)
+        (self.path / 'stats').mkdir(exist_ok=True)
+
+    def _tmp_path(self, relative_path, suffix):
+        # unique for each writer (process and thread)
+        return self.path / (f'{relative_path}.{os.getpid()}.'
+                            f'{threading.get_ident()}.tmp{suffix}')
+
+    def _save_npz(self, relative_path, **arrays):
+        # write to a temporary file first and replace at once so that readers
+        # never see a partial file (np.savez appends .npz to the name)
+        tmp_path = self._tmp_path(relative_path, '.npz')
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path / relative_path)
+
+    def _save_json(self, relative_path, obj):
+        tmp_path = self._tmp_path(relative_path, '.json')
+        with open(tmp_path, 'w') as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, self.path / relative_path)
+
+    def _result_path(self, dataset_key, name):
+        digest = hashlib.blake2b(f'{dataset_key}/{name}'.encode(),
+                                 digest_size=16).hexdigest()
+        return f'results/{dataset_key}/{digest}'
+
+    @staticmethod
+    def dataset_key(X, y, block_size=None):
+        """Hash of the contents of X and y (hex string).
+        Parameters
+        ----------
+        X: array-like of shape(n_samples, n_features)
+            Data. Memory-mapped data is read block by block.
+        y: array-like of shape (n_samples,)
+            Labels of data's instances.
+        block_size: None or int, optional, (default=None)
+            Number of rows hashed at once. If None, a block size keeping each
+            block around DEFAULT_BLOCK_ELEMENTS elements is used.
+        Returns
+        -------
+        str.
+        """
+        y = np.asarray(y)
+        if y.dtype == object:
+            y = y.astype(str)
+        n, d = X.shape
+        if block_size is None:
+            block_size = max(1, DEFAULT_BLOCK_ELEMENTS // max(d, 1))
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f'{X.shape},{np.dtype(X.dtype).str},{y.dtype.str}'.encode())
+        for start in range(0, n, block_size):
+            h.update(np.ascontiguousarray(X[start:start + block_size]).data)
+        h.update(np.ascontiguousarray(y).data)
+
+        return h.hexdigest()
+
+    def result_names(self, dataset_key):
+        """Names of results stored for the dataset (in the order of storing).
+        """
+        entries = []
+        for meta_path in (self.path / 'results' / dataset_key).glob('*.json'):
+            try:
+                with open(meta_path) as f:
+                    entries.append(json.load(f))
+            except FileNotFoundError:
+                # removed after listing
+                continue
+
+        return [
+            entry['name']
+            for entry in sorted(entries, key=lambda entry: entry['saved_at'])
+        ]
+
+    def save_result(self, dataset_key, name, M, alpha, w_tg, w_bg, w_bw):
+        """Store a result of the dataset. A result with the same name is
+        overwritten.
+        Parameters
+        ----------
+        dataset_key: str
+            Key obtained with dataset_key.
+        name: str
+            Name of the result.
+        M: array-like of shape (n_features, n_components)
+            Projection matrix.
+        alpha: float
+            alpha used for the result.
+        w_tg, w_bg, w_bw: dictionary
+            Weights of each label.
+        """
+        relative_path = self._result_path(dataset_key, name)
+        (self.path / 'results' / dataset_key).mkdir(exist_ok=True)
+        arrays = {'M': np.asarray(M), 'alpha': np.asarray(alpha, dtype=float)}
+        for key, weights in (('tg', w_tg), ('bg', w_bg), ('bw', w_bw)):
+            arrays[f'labels_{key}'] = np.array(list(weights))
+            arrays[f'w_{key}'] = np.array(list(weights.values()), dtype=float)
+        self._save_npz(f'{relative_path}.npz', **arrays)
+        # the result is listed after its arrays are written
+        self._save_json(f'{relative_path}.json', {
+            'name': name,
+            'saved_at': time.time()
+        })
+
+    def load_result(self, dataset_key, name):
+        """Load a stored result of the dataset.
+        Returns
+        -------
+        Dictionary with 'M', 'alpha', 'w_tg', 'w_bg', and 'w_bw' keys (same
+        with save_result's parameters). None if not stored.
+        """
+        relative_path = self._result_path(dataset_key, name)
+        if not (self.path / f'{relative_path}.json').exists():
+            return None
+
+        with np.load(self.path / f'{relative_path}.npz') as f:
+            result = {'M': f['M'], 'alpha': float(f['alpha'])}
+            for key in ('tg', 'bg', 'bw'):
+                result[f'w_{key}'] = {
+                    label.item(): float(w)
+                    for label, w in zip(f[f'labels_{key}'], f[f'w_{key}'])
+                }
+
+        return result
+
+    def save_group_stats(self, dataset_key, stats):
+        """Store group statistics (GroupStats) of the dataset."""
+        relative_path = f'stats/{dataset_key}.npz'
+        self._save_npz(relative_path,
+                       labels=stats.labels,
+                       counts=stats.counts,
+                       sums=stats.sums,
+                       scatters=stats.scatters)
+
+    def load_group_stats(self, dataset_key):
+        """Load stored group statistics of the dataset.
+        Returns
+        -------
+        GroupStats instance or None if not stored.
+        """
+        stats_path = self.path / f'stats/{dataset_key}.npz'
+        if not stats_path.exists():
+            return None
+
+        with np.load(stats_path) as f:
+            return GroupStats(f['labels'], f['counts'], f['sums'],
+                              f['scatters'])
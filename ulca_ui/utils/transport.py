@@ -0,0 +1,91 @@
+import json
+import struct
+
+import numpy as np
+
+# Binary message format used between the server and UI:
+#   uint32 (little-endian): byte length of the header
+#   header: UTF-8 JSON of the message where numpy arrays are removed
+#   zero padding to align the following buffers to 4 bytes
+#   buffers: little-endian float32/int32/int16 arrays in the order of
+#            header['buffers'] ([key path, dtype, length] of each array), each
+#            padded to 4 bytes
+# Each array is put back at its key path (e.g., ['content', 'emb', 'x']) when
+# decoding, so that the message has the same structure as the JSON one.
+_DTYPES = {'float32': '<f4', 'int32': '<i4', 'int16': '<i2'}
+
+
+def _split_arrays(obj, path, arrays):
+    if isinstance(obj, np.ndarray):
+        arrays.append((path, obj))
+        return None
+    if isinstance(obj, dict):
+        return {
+            key: _split_arrays(val, path + [key], arrays)
+            for key, val in obj.items()
+        }
+    return obj
+
+
+def encode_binary(message):
+    """Encode a message containing numpy arrays into the binary format.
+    int16 arrays are sent as int16, the other integer arrays as int32, and
+    the other arrays as float32.
+    Parameters
+    ----------
+    message: dictionary
+        JSON-serializable dictionary except for values of numpy arrays.
+    Returns
+    -------
+    bytearray.
+    """
+    arrays = []
+    header = _split_arrays(message, [], arrays)
+    buffers = []
+    header['buffers'] = []
+    for path, arr in arrays:
+        if arr.dtype == np.int16:
+            dtype = 'int16'
+        elif np.issubdtype(arr.dtype, np.integer):
+            dtype = 'int32'
+        else:
+            dtype = 'float32'
+        buffers.append(np.ascontiguousarray(arr.ravel(), dtype=_DTYPES[dtype]))
+        header['buffers'].append([path, dtype, int(arr.size)])
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    # 4-byte alignment allows the client to read buffers without copying
+    header_bytes += b' ' * (-(4 + len(header_bytes)) % 4)
+
+    data = bytearray(struct.pack('<I', len(header_bytes)))
+    data += header_bytes
+    for buffer in buffers:
+        data += buffer.tobytes()
+        data += bytes(-buffer.nbytes % 4)
+
+    return data
+
+
+def decode_binary(data):
+    """Decode a message in the binary format.
+    Parameters
+    ----------
+    data: bytes or bytearray
+    Returns
+    -------
+    message: dictionary where arrays are numpy arrays.
+    """
+    header_len = struct.unpack_from('<I', data)[0]
+    message = json.loads(bytes(data[4:4 + header_len]).decode('utf-8'))
+    offset = 4 + header_len
+    for path, dtype, length in message.pop('buffers'):
+        arr = np.frombuffer(data, dtype=_DTYPES[dtype], count=length,
+                            offset=offset)
+        offset += arr.nbytes + (-arr.nbytes % 4)
+
+        target = message
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = arr
+
+    return message
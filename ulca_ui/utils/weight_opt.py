@@ -1,30 +1,45 @@
+import copy
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
 import autograd.numpy as np
 from scipy import optimize
 from scipy.spatial.distance import pdist
 
-from .geom_trans import find_best_rotate
+from manopt_dr.group_stats import GroupStats
+from .geom_trans import find_best_rotate, find_best_rotate_from_cross
 
 
 def cost_area(updated_label, ideal_areas, Z, y):
     uniq_labels = np.unique(y)
 
-    class_areas = {}
-    for label in uniq_labels:
+    class_scatters = np.zeros((len(uniq_labels), Z.shape[1], Z.shape[1]))
+    for i, label in enumerate(uniq_labels):
         means = Z[y == label, :].mean(axis=0)
         Z_centered = Z[y == label, :] - means
-        Cov = Z_centered.T @ Z_centered
+        class_scatters[i] = Z_centered.T @ Z_centered
+
+    return cost_area_from_stats(updated_label, ideal_areas, uniq_labels,
+                                class_scatters)
+
+
+def cost_area_from_stats(updated_label, ideal_areas, labels, class_scatters):
+    class_areas = {}
+    for label, Cov in zip(labels, class_scatters):
         # skip using pi
         class_areas[label] = np.sqrt(Cov[0, 0]) * np.sqrt(Cov[1, 1])
 
     cost = 0.0
-    for label in uniq_labels:
+    for label in labels:
         ideal = ideal_areas[updated_label] / ideal_areas[label] if ideal_areas[
             label] > 0 else -1
         actual = class_areas[updated_label] / class_areas[
             label] if class_areas[label] > 0 else -1
 
         # normalized loss within 0-1
-        cost += min(1, np.abs((ideal - actual) / ideal)) / len(uniq_labels)
+        cost += min(1, np.abs((ideal - actual) / ideal)) / len(labels)
 
     return cost
 
@@ -36,6 +51,10 @@ def cost_dist(updated_label, ideal_dists, Z, y):
     for i, label in enumerate(uniq_labels):
         class_centers[i, :] = Z[y == label, :].mean(axis=0)
 
+    return cost_dist_from_stats(updated_label, ideal_dists, class_centers)
+
+
+def cost_dist_from_stats(updated_label, ideal_dists, class_centers):
     actual_dists = pdist(class_centers)
 
     # normalized loss within 0-1
@@ -67,6 +86,28 @@ def total_cost(updated_label,
     return cost
 
 
+def total_cost_from_stats(updated_label,
+                          ideal_areas,
+                          ideal_dists,
+                          labels,
+                          class_centers,
+                          class_scatters,
+                          w_area=0.5,
+                          w_dist=0.5):
+    # same with total_cost but uses each class's center and scatter matrix in
+    # the embedding instead of the embedding itself
+    c_area = cost_area_from_stats(updated_label=updated_label,
+                                  ideal_areas=ideal_areas,
+                                  labels=labels,
+                                  class_scatters=class_scatters)
+    c_dist = cost_dist_from_stats(updated_label=updated_label,
+                                  ideal_dists=ideal_dists,
+                                  class_centers=class_centers)
+    cost = w_area * c_area + w_dist * c_dist
+
+    return cost
+
+
 def gen_cost_func(dr,
                   updated_label,
                   ideal_areas,
@@ -80,33 +121,21 @@ def gen_cost_func(dr,
                   w_dist=0.5,
                   Z_prev=None,
                   apply_geom_trans=True,
-                  n_components=2):
+                  n_components=2,
+                  fit_cache=None):
     uniq_labels = np.unique(y)
-    _Covs = {}
-
-    # precompute Covs for faster optimization
-    if len(Covs.keys()) == 0:
-        X_c = X - X.mean(axis=0)
-        class_mean = {}
-        for label in uniq_labels:
-            class_mean[label] = X_c[y == label, :].mean(axis=0)
-
-        X_class_mean = np.zeros(X.shape)
-        for label in uniq_labels:
-            X_class_mean[y == label, :] = class_mean[label]
-
-        all_mean = 0  # this equals to X_c.mean()
-
-        for label in uniq_labels:
-            # to compute within-cov
-            WI = X_c[y == label, :] - X_class_mean[y == label, :]
-            # to compute between-cov
-            BW = X_class_mean[y == label, :] - all_mean
-            Cov_within = WI.T @ WI
-            Cov_between = BW.T @ BW
-            Covs[label] = {'within': Cov_within, 'between': Cov_between}
-    else:
-        _Covs = Covs
+
+    # precompute group statistics for faster optimization
+    if not isinstance(Covs, GroupStats) and len(Covs.keys()) == 0:
+        Covs = GroupStats.from_data(X, y)
+
+    # when group statistics are available, class centers and scatter matrices
+    # in the embedding are computed from M without projecting all instances
+    # (Z = X @ M: centers = means @ M, scatters = M^T S M,
+    #  Z_prev^T Z = (Z_prev^T X) @ M)
+    use_stats = isinstance(Covs, GroupStats)
+    if use_stats and apply_geom_trans and Z_prev is not None:
+        Z_prev_T_X = Z_prev.T @ X
 
     def cost_func(weights):
         # TODO: find better way for separating weights from Dash's inputs
@@ -128,13 +157,41 @@ def gen_cost_func(dr,
         else:
             alpha_ = alpha
 
-        Z = dr.fit(X,
+        if fit_cache is None:
+            dr.fit(X,
                    y=y,
                    w_tg=w_tg,
                    w_bg=w_bg,
                    w_bw=w_bw,
                    Covs=Covs,
-                   alpha=alpha_).transform(X)
+                   alpha=alpha_)
+        else:
+            fit_cache.fit(dr,
+                          X,
+                          y=y,
+                          w_tg=w_tg,
+                          w_bg=w_bg,
+                          w_bw=w_bw,
+                          Covs=Covs,
+                          alpha=alpha_)
+
+        if use_stats:
+            M = dr.M
+            if apply_geom_trans and Z_prev is not None:
+                M = M @ find_best_rotate_from_cross(Z_prev_T_X @ M)
+            class_centers = Covs.means @ M
+            class_scatters = M.T @ Covs.scatters @ M
+
+            return total_cost_from_stats(updated_label=updated_label,
+                                         ideal_areas=ideal_areas,
+                                         ideal_dists=ideal_dists,
+                                         labels=Covs.labels,
+                                         class_centers=class_centers,
+                                         class_scatters=class_scatters,
+                                         w_area=w_area,
+                                         w_dist=w_dist)
+
+        Z = dr.transform(X)
 
         if apply_geom_trans and Z_prev is not None:
             R = find_best_rotate(Z_prev, Z)
@@ -151,6 +208,203 @@ def gen_cost_func(dr,
     return cost_func
 
 
+def _total_cost_of_proj(M, labels, means, scatters, updated_label,
+                        ideal_areas, ideal_dists, w_area, w_dist, Z_prev_T_X):
+    # total_cost_from_stats written with differentiable operations (used with
+    # autograd to obtain the gradient with respect to projection matrix M)
+    if Z_prev_T_X is not None:
+        U, _, Vh = np.linalg.svd(Z_prev_T_X @ M, full_matrices=False)
+        M = M @ (Vh.T @ U.T)
+    class_centers = means @ M
+    class_scatters = np.einsum('dk,cdl->ckl', M, np.dot(scatters, M))
+
+    # area cost (same with cost_area_from_stats)
+    areas = np.sqrt(class_scatters[:, 0, 0]) * np.sqrt(class_scatters[:, 1,
+                                                                      1])
+    i = int(np.flatnonzero(labels == updated_label)[0])
+    ideal_area_vals = np.array([ideal_areas[label] for label in labels])
+    ideal = np.where(ideal_area_vals > 0,
+                     ideal_area_vals[i] / ideal_area_vals, -1)
+    actual = np.where(areas > 0, areas[i] / areas, -1)
+    c_area = np.mean(np.minimum(1, np.abs((ideal - actual) / ideal)))
+
+    # distance cost (same with cost_dist_from_stats)
+    rows, cols = np.triu_indices(len(labels), 1)  # same order with pdist
+    diffs = class_centers[rows] - class_centers[cols]
+    actual_dists = np.sqrt(np.sum(diffs**2, axis=1))
+    denom = np.sqrt((ideal_dists**2).sum())
+    c_dist = np.sqrt(np.sum((ideal_dists - actual_dists)**2)) / denom if denom > 0 else 1
+
+    return w_area * c_area + w_dist * c_dist
+
+
+def gen_cost_grad_func(dr,
+                       updated_label,
+                       ideal_areas,
+                       ideal_dists,
+                       X,
+                       y,
+                       alpha,
+                       with_alpha,
+                       Covs,
+                       w_area=0.5,
+                       w_dist=0.5,
+                       Z_prev=None,
+                       apply_geom_trans=True,
+                       n_components=2):
+    # Generate a function returning the cost and its gradient with respect to
+    # the weights (and alpha when with_alpha is True). The embedding is the
+    # top eigenvectors of C = C0 - alpha * C1 as in ULCA with a fixed alpha.
+    # The gradient is obtained with the perturbation of eigenvectors:
+    #   dv_i = sum_{j != i} v_j (v_j^T dC v_i) / (lambda_i - lambda_j),
+    # and thus dcost = sum_i u_i^T dC v_i with
+    #   u_i = sum_{j != i} v_j (v_j^T g_i) / (lambda_i - lambda_j),
+    # where g_i is the gradient of the cost with respect to v_i.
+    # When apply_geom_trans is True, the cost is invariant to rotations within
+    # the embedding's subspace, so only j outside of the top eigenvectors are
+    # used (which avoids division by close eigenvalues).
+    from autograd import value_and_grad
+    from ulca.ulca import EVDULCA
+
+    if not isinstance(Covs, GroupStats):
+        Covs = GroupStats.from_data(X, y)
+    stats = Covs
+
+    # EVDULCA uses scatter matrices and manifold ULCA uses covariance matrices
+    is_evd = isinstance(dr, EVDULCA)
+    normalize = not is_evd
+    k = dr.n_components if hasattr(dr, 'n_components') else n_components
+    d = stats.n_features
+    c = stats.n_groups
+
+    rotate = apply_geom_trans and Z_prev is not None
+    Z_prev_T_X = Z_prev.T @ X if rotate else None
+    diffs = stats.means - stats.mean
+    scale = 1 / stats.counts if normalize else np.ones(c)
+    bw_coef = np.ones(c) if normalize else stats.counts.astype(float)
+    ideal_dists = np.asarray(ideal_dists, dtype=float)
+
+    cost_and_grad_of_proj = value_and_grad(
+        lambda M: _total_cost_of_proj(M, stats.labels, stats.means, stats.
+                                      scatters, updated_label, ideal_areas,
+                                      ideal_dists, w_area, w_dist, Z_prev_T_X))
+
+    def cost_grad_func(weights):
+        weights = np.asarray(weights, dtype=float)
+        w_tg = weights[:c]
+        w_bg = weights[c:c * 2]
+        w_bw = weights[c * 2:c * 3]
+        alpha_ = weights[-1] if with_alpha else alpha
+
+        # same with the default gamma0 and gamma1 used in fit
+        gamma0 = 1 if w_tg.sum() + w_bw.sum() == 0 else 0
+        gamma1 = 1 if is_evd and w_bg.sum() == 0 else 0
+
+        C0, C1 = stats.weighted_covs(w_tg,
+                                     w_bg,
+                                     w_bw,
+                                     normalize=normalize)
+        C0[np.diag_indices(d)] += gamma0
+        C1[np.diag_indices(d)] += gamma1
+        lambdas, V = np.linalg.eigh(C0 - alpha_ * C1)
+        top = np.arange(d - 1, d - 1 - k, -1)
+        M = V[:, top]
+
+        cost, G = cost_and_grad_of_proj(M)
+
+        U = np.zeros((d, k))
+        others = np.arange(d - k) if rotate else None
+        for i, t in enumerate(top):
+            js = others if rotate else np.delete(np.arange(d), t)
+            gaps = lambdas[t] - lambdas[js]
+            gaps[np.abs(gaps) < 1e-12] = np.inf
+            U[:, i] = V[:, js] @ ((V[:, js].T @ G[:, i]) / gaps)
+
+        # derivatives of C with respect to each weight and alpha
+        SM = np.dot(stats.scatters, M)  # (n_groups, n_features, k)
+        uWv = np.einsum('dk,cdk->c', U, SM) * scale
+        uBv = np.sum((diffs @ U) * (diffs @ M), axis=1) * bw_coef
+        grad = np.concatenate((uWv, -alpha_ * uWv, uBv))
+        if with_alpha:
+            grad = np.append(grad, -np.sum(U * (C1 @ M)))
+
+        return cost, grad
+
+    return cost_grad_func
+
+
+class _StopRequested(Exception):
+    pass
+
+
+def _minimize_until(cost_func,
+                    initial_weights,
+                    n_weights,
+                    with_alpha,
+                    should_stop,
+                    jac,
+                    **minimize_kwargs):
+    # run optimize.minimize while keeping the best feasible evaluated point
+    # and stop it when should_stop() becomes True
+    best = {'weights': None, 'cost': np.inf}
+
+    def tracked_cost_func(weights):
+        if should_stop():
+            raise _StopRequested()
+        result = cost_func(weights)
+        cost = result[0] if jac else result
+
+        weights = np.asarray(weights, dtype=float)
+        feasible = np.all(weights[:n_weights] >= 0) and np.all(
+            weights[:n_weights] <= 1) and (not with_alpha or weights[-1] >= 0)
+        if feasible and cost < best['cost']:
+            best['weights'] = weights.copy()
+            best['cost'] = cost
+
+        return result
+
+    try:
+        opt_result = optimize.minimize(tracked_cost_func,
+                                       initial_weights,
+                                       jac=jac,
+                                       **minimize_kwargs)
+        return opt_result.x, opt_result.fun
+    except _StopRequested:
+        return best['weights'], best['cost']
+
+
+def _grad_unsupported_reason(dr, with_alpha, alpha, Z_prev,
+                             apply_geom_trans):
+    # the gradient of gen_cost_grad_func assumes a fixed (not automatically
+    # selected) alpha and the embedding that is the eigenbasis of
+    # C0 - alpha * C1. without the rotation to Z_prev, the cost depends on the
+    # basis, and the bases of manifold ULCA (chosen by the manifold optimizer)
+    # and of varimax rotation cannot be followed by the gradient
+    from ulca.ulca import EVDULCA
+
+    if not with_alpha and alpha is None:
+        return 'alpha or with_alpha=True'
+    if not (apply_geom_trans and Z_prev is not None) and (
+            not isinstance(dr, EVDULCA) or dr.apply_varimax):
+        return ('EVDULCA without varimax rotation or apply_geom_trans=True '
+                'with Z_prev')
+    return None
+
+
+def resolve_method(dr,
+                   method,
+                   with_alpha=True,
+                   alpha=None,
+                   Z_prev=None,
+                   apply_geom_trans=True):
+    # optimization method that optimize_cost uses with the same arguments
+    # (L-BFGS-B is replaced with COBYLA when the gradient is not available)
+    if method == 'L-BFGS-B' and _grad_unsupported_reason(
+            dr, with_alpha, alpha, Z_prev, apply_geom_trans) is not None:
+        return 'COBYLA'
+    return method
+
+
 def optimize_cost(dr,
                   initial_weights,
                   updated_label,
@@ -168,44 +422,137 @@ def optimize_cost(dr,
                   n_components=2,
                   method='COBYLA',
                   options={'maxiter': 30},
-                  constraints='auto'):
-    cost_func = gen_cost_func(dr=dr,
-                              updated_label=updated_label,
-                              ideal_areas=ideal_areas,
-                              ideal_dists=ideal_dists,
-                              X=X,
-                              y=y,
-                              with_alpha=with_alpha,
-                              alpha=alpha,
-                              Covs=Covs,
-                              w_area=w_area,
-                              w_dist=w_dist,
-                              Z_prev=Z_prev,
-                              apply_geom_trans=apply_geom_trans,
-                              n_components=n_components)
-
-    def nonneg(a):
-        return lambda x: x[a]
-
-    def less_or_eq_to_1(a):
-        return lambda x: 1 - x[a]
-
-    if constraints == 'auto':
-        constraints = []
-        for i in range(len(initial_weights)):
-            constraints.append({'type': 'ineq', 'fun': nonneg(i)})
-            constraints.append({'type': 'ineq', 'fun': less_or_eq_to_1(i)})
-
-    if with_alpha:
-        initial_weights = list(initial_weights) + [alpha]
-        constraints.append({'type': 'ineq', 'fun': nonneg(-1)})
-
-    opt_result = optimize.minimize(cost_func,
-                                   initial_weights,
-                                   method=method,
-                                   options=options,
-                                   constraints=constraints)
-    optimized_weights = opt_result.x
-    cost = opt_result.fun
+                  constraints='auto',
+                  fit_cache=None,
+                  n_starts=1,
+                  time_budget=None,
+                  n_jobs=None,
+                  random_state=None,
+                  cancel_event=None):
+    # n_starts > 1: the optimization is also started from random weights
+    # (and alpha scaled from the given alpha) in parallel with a thread pool
+    # (n_jobs workers; default: min(n_starts, # of CPUs)).
+    # time_budget (in seconds): all runs are stopped at the deadline and the
+    # best feasible weights found so far are returned.
+    # cancel_event (threading.Event): when it is set (e.g., by a newer request
+    # from UI), all runs are stopped in the same way as time_budget.
+    n_weights = len(initial_weights)
+
+    # group statistics are computed once and shared by all runs
+    if not isinstance(Covs, GroupStats) and len(Covs.keys()) == 0:
+        Covs = GroupStats.from_data(X, y)
+
+    if with_alpha and alpha is None:
+        # start from the alpha of the fitted model (e.g., automatically
+        # selected by EVDULCA)
+        alpha = getattr(dr, 'alpha', None) or 1.0
+
+    reason = _grad_unsupported_reason(dr, with_alpha, alpha, Z_prev,
+                                      apply_geom_trans)
+    if method == 'L-BFGS-B' and reason is not None:
+        warnings.warn(f'L-BFGS-B requires {reason}. COBYLA is used instead.')
+        method = 'COBYLA'
+    use_grad = method == 'L-BFGS-B'
+    minimize_kwargs = {'method': method, 'options': options}
+    if use_grad:
+        # gradient-based optimization with box bounds of weights and alpha
+        bounds = [(0, 1)] * n_weights
+        if with_alpha:
+            bounds.append((0, None))
+        minimize_kwargs['bounds'] = bounds
+    else:
+
+        def nonneg(a):
+            return lambda x: x[a]
+
+        def less_or_eq_to_1(a):
+            return lambda x: 1 - x[a]
+
+        if constraints == 'auto':
+            constraints = []
+            for i in range(n_weights):
+                constraints.append({'type': 'ineq', 'fun': nonneg(i)})
+                constraints.append({'type': 'ineq', 'fun': less_or_eq_to_1(i)})
+
+        if with_alpha:
+            constraints = list(constraints) + [{
+                'type': 'ineq',
+                'fun': nonneg(-1)
+            }]
+        minimize_kwargs['constraints'] = constraints
+
+    deadline = None if time_budget is None else time.perf_counter(
+    ) + time_budget
+
+    def should_stop():
+        return (deadline is not None and time.perf_counter() > deadline) or (
+            cancel_event is not None and cancel_event.is_set())
+
+    starts = [list(initial_weights) + ([alpha] if with_alpha else [])]
+    rng = np.random.default_rng(random_state)
+    for _ in range(n_starts - 1):
+        start = list(rng.uniform(0, 1, n_weights))
+        if with_alpha:
+            start.append(alpha * 2**rng.uniform(-2, 2))
+        starts.append(start)
+
+    def gen_func_kwargs(dr_):
+        return {
+            'dr': dr_,
+            'updated_label': updated_label,
+            'ideal_areas': ideal_areas,
+            'ideal_dists': ideal_dists,
+            'X': X,
+            'y': y,
+            'with_alpha': with_alpha,
+            'alpha': alpha,
+            'Covs': Covs,
+            'w_area': w_area,
+            'w_dist': w_dist,
+            'Z_prev': Z_prev,
+            'apply_geom_trans': apply_geom_trans,
+            'n_components': n_components
+        }
+
+    def run(start, dr_):
+        if should_stop():
+            return None, np.inf
+
+        if use_grad:
+            cost_func = gen_cost_grad_func(**gen_func_kwargs(dr_))
+        else:
+            cost_func = gen_cost_func(fit_cache=fit_cache,
+                                      **gen_func_kwargs(dr_))
+
+        return _minimize_until(cost_func,
+                               start,
+                               n_weights=n_weights,
+                               with_alpha=with_alpha,
+                               should_stop=should_stop,
+                               jac=use_grad,
+                               **minimize_kwargs)
+
+    if len(starts) == 1:
+        results = [run(starts[0], dr)]
+    else:
+        # each run refits its own copy of dr. by default, runs more than
+        # the number of CPUs wait for earlier runs (the run from
+        # initial_weights is started first and not slowed down by others)
+        if n_jobs is None:
+            n_jobs = min(len(starts), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(
+                executor.map(run, starts,
+                             [copy.deepcopy(dr) for _ in starts]))
+
+    optimized_weights, cost = min(results, key=lambda result: result[1])
+    if optimized_weights is None:
+        # stopped before evaluating any feasible weights
+        optimized_weights, cost = np.array(starts[0]), np.nan
+    elif use_grad:
+        # report the cost of the refit embedding (same with COBYLA) instead of
+        # the value computed by the gradient's model of the embedding
+        cost = gen_cost_func(fit_cache=fit_cache,
+                             **gen_func_kwargs(dr))(optimized_weights)
 
     return optimized_weights, cost